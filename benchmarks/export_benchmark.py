@@ -0,0 +1,202 @@
+"""Benchmark Kerox ONNX export against Keras inference on CPU.
+
+Builds `KeroxSequential`/`KeroxFunctional` MLPs of configurable depth and width
+and, for every installed Keras backend (each run in its own process, since the
+backend is fixed at import time), measures:
+
+- export time, node count and serialized size of the exported model,
+- latency percentiles and throughput of Keras `predict_on_batch` and of an
+  ONNX Runtime session of the exported model, across batch sizes.
+
+Results are printed (or written with `--output`) as JSON lines, one record per
+measurement, so they can be collected and compared across commits.
+
+Usage:
+
+    python benchmarks/export_benchmark.py --depths 2 8 --widths 64 256 \
+        --batch-sizes 1 32 512 --output bench.jsonl
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+
+KERAS_BACKENDS = ("jax", "tensorflow", "torch")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--apis", nargs="+", default=["sequential", "functional"])
+    parser.add_argument("--depths", nargs="+", type=int, default=[2, 8])
+    parser.add_argument("--widths", nargs="+", type=int, default=[64, 256])
+    parser.add_argument("--features", type=int, default=32)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 32, 512])
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--intra-op-threads", type=int, default=1)
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=None,
+        help="Keras backends to benchmark. Defaults to all installed ones.",
+    )
+    parser.add_argument("--output", default=None, help="JSON lines output file.")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def installed_backends():
+    return [name for name in KERAS_BACKENDS if importlib.util.find_spec(name)]
+
+
+def build_model(api: str, depth: int, width: int, features: int):
+    from kerox import KeroxInput, layers, models
+
+    hidden = [layers.Dense(width, activation="relu") for _ in range(depth)]
+    if api == "sequential":
+        return models.KeroxSequential(
+            [layers.InputLayer(shape=(features,)), *hidden, layers.Dense(1)]
+        )
+    if api == "functional":
+        inputs = KeroxInput(shape=(features,))
+        x = inputs
+        for layer in hidden:
+            x = layer(x)
+        return models.KeroxModel(inputs=inputs, outputs=layers.Dense(1)(x))
+    raise ValueError(f"Unknown api: {api}")
+
+
+def time_calls(fn, repeats: int, warmup: int) -> list[float]:
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def latency_stats(timings: list[float], batch_size: int) -> dict:
+    import numpy as np
+
+    timings_ms = np.asarray(timings) * 1e3
+    return {
+        "p50_ms": float(np.percentile(timings_ms, 50)),
+        "p90_ms": float(np.percentile(timings_ms, 90)),
+        "p99_ms": float(np.percentile(timings_ms, 99)),
+        "mean_ms": float(timings_ms.mean()),
+        "throughput_samples_per_s": float(batch_size * 1e3 / timings_ms.mean()),
+    }
+
+
+def worker_argv(args) -> list[str]:
+    return [
+        "--worker",
+        "--apis",
+        *args.apis,
+        "--depths",
+        *map(str, args.depths),
+        "--widths",
+        *map(str, args.widths),
+        "--features",
+        str(args.features),
+        "--batch-sizes",
+        *map(str, args.batch_sizes),
+        "--repeats",
+        str(args.repeats),
+        "--warmup",
+        str(args.warmup),
+        "--intra-op-threads",
+        str(args.intra_op_threads),
+    ]
+
+
+def run_worker(args):
+    import keras
+    import numpy as np
+
+    from kerox import export, runtime
+
+    backend = keras.backend.backend()
+    rng = np.random.default_rng(0)
+    for api in args.apis:
+        for depth in args.depths:
+            for width in args.widths:
+                model = build_model(api, depth, width, args.features)
+                config = {
+                    "backend": backend,
+                    "api": api,
+                    "depth": depth,
+                    "width": width,
+                    "features": args.features,
+                }
+
+                start = time.perf_counter()
+                model_proto = export.build_onnx_model(model)
+                export_time = time.perf_counter() - start
+                yield {
+                    **config,
+                    "kind": "export",
+                    "export_time_s": export_time,
+                    "node_count": len(model_proto.graph.node),
+                    "model_size_bytes": model_proto.ByteSize(),
+                }
+
+                session = runtime.make_inference_session(
+                    model_proto, intra_op_num_threads=args.intra_op_threads
+                )
+                input_name = session.get_inputs()[0].name
+                for batch_size in args.batch_sizes:
+                    x = rng.standard_normal((batch_size, args.features))
+                    x = x.astype("float32")
+                    runners = {
+                        "keras": lambda: model.predict_on_batch(x),
+                        "onnxruntime": lambda: session.run(None, {input_name: x}),
+                    }
+                    for runner, fn in runners.items():
+                        timings = time_calls(fn, args.repeats, args.warmup)
+                        yield {
+                            **config,
+                            "kind": "inference",
+                            "runtime": runner,
+                            "batch_size": batch_size,
+                            **latency_stats(timings, batch_size),
+                        }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        for record in run_worker(args):
+            print(json.dumps(record), flush=True)
+        return
+
+    backends = args.backends or installed_backends()
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for backend in backends:
+            result = subprocess.run(
+                [sys.executable, __file__, *worker_argv(args)],
+                env={**os.environ, "KERAS_BACKEND": backend},
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode != 0:
+                print(result.stderr, file=sys.stderr)
+                raise RuntimeError(f"Benchmark worker for backend {backend} failed")
+            for line in result.stdout.splitlines():
+                if line.startswith("{"):
+                    output.write(line + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark the import time of kerox entry points.
+
+Each module is imported in a fresh interpreter, several times, and the wall
+time of the import is reported along with the heavy dependencies it pulled in.
+Inference-only entry points must not import Keras, its backends, spox or
+ndonnx; `--check` exits with an error if they do, so it can run in CI.
+
+Results are printed (or written with `--output`) as JSON lines, one record per
+module.
+
+Usage:
+
+    python benchmarks/import_benchmark.py --repeats 5 --check
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Entry points meant for processes that only run already exported models
+INFERENCE_MODULES = ("kerox", "kerox.runtime", "kerox.serving", "kerox.external_data")
+EXPORT_MODULES = ("kerox.export", "kerox.models", "kerox.layers")
+HEAVY_DEPENDENCIES = ("keras", "tensorflow", "jax", "torch", "spox", "ndonnx")
+
+WORKER_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"import_time_s": elapsed, "heavy_dependencies": heavy}}))
+"""
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--modules",
+        nargs="+",
+        default=[*INFERENCE_MODULES, *EXPORT_MODULES],
+        help="Modules to import. Defaults to the inference and export entry points.",
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Fail if an inference-only module imports a heavy dependency.",
+    )
+    parser.add_argument("--output", default=None, help="JSON lines output file.")
+    return parser.parse_args(argv)
+
+
+def measure_import(module: str) -> dict:
+    code = WORKER_CODE.format(module=module, heavy=HEAVY_DEPENDENCIES)
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        raise RuntimeError(f"Importing {module} failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    failures = []
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        for module in args.modules:
+            runs = [measure_import(module) for _ in range(args.repeats)]
+            timings = [run["import_time_s"] for run in runs]
+            record = {
+                "module": module,
+                "inference_only": module in INFERENCE_MODULES,
+                "median_s": statistics.median(timings),
+                "min_s": min(timings),
+                "max_s": max(timings),
+                "heavy_dependencies": runs[0]["heavy_dependencies"],
+            }
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            if record["inference_only"] and record["heavy_dependencies"]:
+                failures.append(record)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if args.check and failures:
+        for record in failures:
+            print(
+                f"{record['module']} imports {record['heavy_dependencies']}",
+                file=sys.stderr,
+            )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
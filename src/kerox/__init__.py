@@ -1,2 +1,37 @@
-from kerox.core import KeroxTensor, KeroxVariable, ONNXBuildScope  # noqa: F401
-from kerox.layers.input_layer import InputLayer, KeroxInput  # noqa: F401
+# Attributes and submodules are imported on first access (PEP 562), so that
+# inference-only entry points such as `kerox.runtime` and `kerox.serving` don't
+# pay for importing Keras and its backend.
+import importlib
+from typing import TYPE_CHECKING
+
+from kerox.__about__ import __version__  # noqa: F401
+
+if TYPE_CHECKING:
+    from kerox.core import KeroxTensor, KeroxVariable, ONNXBuildScope  # noqa: F401
+    from kerox.layers.input_layer import InputLayer, KeroxInput  # noqa: F401
+
+_LAZY_ATTRIBUTES = {
+    "KeroxTensor": "kerox.core",
+    "KeroxVariable": "kerox.core",
+    "ONNXBuildScope": "kerox.core",
+    "InputLayer": "kerox.layers.input_layer",
+    "KeroxInput": "kerox.layers.input_layer",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    else:
+        try:
+            value = importlib.import_module(f"{__name__}.{name}")
+        except ModuleNotFoundError as e:
+            if e.name != f"{__name__}.{name}":
+                raise
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
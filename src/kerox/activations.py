@@ -4,6 +4,7 @@ from keras import activations, saving
 
 from kerox.core import KeroxTensor, in_onnx_build_scope
 from kerox.ops.utils import (
+    float32_if_mixed_precision,
     kops,
     sops,
     spox_auto_adapt_op,
@@ -29,8 +30,11 @@ def tanh(x: ArrayOrTensor) -> ArrayOrTensor: ...
 
 
 @saving.register_keras_serializable(package="kerox")
-@spox_auto_adapt_op(kops.softmax, sops.softmax)
-def softmax(x: ArrayOrTensor, *, axis=-1) -> ArrayOrTensor: ...
+def softmax(x: ArrayOrTensor, *, axis=-1) -> ArrayOrTensor:
+    if in_onnx_build_scope():
+        x = float32_if_mixed_precision(to_spox_var(x))
+        return KeroxTensor(spox_var=sops.softmax(x, axis=axis))
+    return kops.softmax(x, axis=axis)
 
 
 @saving.register_keras_serializable(package="kerox")
@@ -86,17 +90,8 @@ def celu(x: ArrayOrTensor, *, alpha=1.0) -> ArrayOrTensor: ...
 @saving.register_keras_serializable(package="kerox")
 def soft_shrink(x: ArrayOrTensor, threshold=0.5) -> ArrayOrTensor:
     if in_onnx_build_scope():
-        x = to_spox_var(x)
-        plus_threshold = spox_constant_like(x, threshold)
-        minus_threshold = spox_constant_like(x, -threshold)
-        zero = spox_constant_like(x, 0)
-        result = sops.if_(
-            sops.greater(x, plus_threshold),
-            (sops.sub(x, plus_threshold),),
-            sops.if_(
-                sops.less(x, minus_threshold), (sops.add(x, plus_threshold),), (zero,)
-            ),
-        )[0]
+        # Element-wise: x - t if x > t, x + t if x < -t, 0 otherwise
+        result = sops.shrink(to_spox_var(x), bias=threshold, lambd=threshold)
         return KeroxTensor(spox_var=result)
     return kops.soft_shrink(x, threshold=threshold)
 
@@ -121,10 +116,10 @@ def squareplus(x: ArrayOrTensor, b=4) -> ArrayOrTensor:
     if in_onnx_build_scope():
         x = to_spox_var(x)
         b = spox_constant_like(x, b)
-        num = sops.add(x, sops.sqrt(sops.add(sops.square(x), b)))
+        num = sops.add(x, sops.sqrt(sops.add(sops.mul(x, x), b)))
         den = spox_constant_like(num, 2)
         return KeroxTensor(spox_var=sops.div(num, den))
-    return kops.squareplus(x)
+    return kops.squareplus(x, b=b)
 
 
 @saving.register_keras_serializable(package="kerox")
@@ -148,7 +143,8 @@ def glu(x: ArrayOrTensor, *, axis=-1) -> ArrayOrTensor:
 @saving.register_keras_serializable(package="kerox")
 def tanh_shrink(x: ArrayOrTensor) -> ArrayOrTensor:
     if in_onnx_build_scope():
-        return KeroxTensor(spox_var=sops.mul(to_spox_var(x), sops.tanh(to_spox_var(x))))
+        x = to_spox_var(x)
+        return KeroxTensor(spox_var=sops.sub(x, sops.tanh(x)))
     return kops.tanh_shrink(x)
 
 
@@ -158,8 +154,12 @@ def exponential(x: ArrayOrTensor) -> ArrayOrTensor: ...
 
 
 @saving.register_keras_serializable(package="kerox")
-@spox_auto_adapt_op(kops.hard_sigmoid, sops.hard_sigmoid)
-def hard_sigmoid(x: ArrayOrTensor) -> ArrayOrTensor: ...
+def hard_sigmoid(x: ArrayOrTensor) -> ArrayOrTensor:
+    if in_onnx_build_scope():
+        # Keras uses relu6(x + 3) / 6, ONNX defaults to alpha=0.2
+        result = sops.hard_sigmoid(to_spox_var(x), alpha=1 / 6, beta=0.5)
+        return KeroxTensor(spox_var=result)
+    return kops.hard_sigmoid(x)
 
 
 @saving.register_keras_serializable(package="kerox")
@@ -174,12 +174,9 @@ def hard_tanh(x: ArrayOrTensor) -> ArrayOrTensor:
 @saving.register_keras_serializable(package="kerox")
 def hard_shrink(x: ArrayOrTensor, threshold=0.5) -> ArrayOrTensor:
     if in_onnx_build_scope():
-        x = to_spox_var(x)
-        threshold = spox_constant_like(x, threshold)
-        zero = spox_constant_like(x, 0)
-        cond_x = sops.greater(sops.abs(x), threshold)
-        return KeroxTensor(spox_var=sops.if_(cond_x, (x,), (zero,))[0])
-
+        # Element-wise: x if |x| > t, 0 otherwise
+        result = sops.shrink(to_spox_var(x), bias=0.0, lambd=threshold)
+        return KeroxTensor(spox_var=result)
     return kops.hard_shrink(x, threshold=threshold)
 
 
@@ -196,14 +193,19 @@ def mish(x: ArrayOrTensor) -> ArrayOrTensor: ...
 
 
 @saving.register_keras_serializable(package="kerox")
-@spox_auto_adapt_op(kops.log_softmax, sops.log_softmax)
-def log_softmax(x: ArrayOrTensor, *, axis=-1) -> ArrayOrTensor: ...
+def log_softmax(x: ArrayOrTensor, *, axis=-1) -> ArrayOrTensor:
+    if in_onnx_build_scope():
+        x = float32_if_mixed_precision(to_spox_var(x))
+        return KeroxTensor(spox_var=sops.log_softmax(x, axis=axis))
+    return kops.log_softmax(x, axis=axis)
 
 
 @saving.register_keras_serializable(package="kerox")
 def log_sigmoid(x: ArrayOrTensor) -> ArrayOrTensor:
     if in_onnx_build_scope():
-        return KeroxTensor(spox_var=sops.log(sops.sigmoid(to_spox_var(x))))
+        # -softplus(-x) doesn't underflow to log(0) for large negative inputs
+        x = sops.neg(float32_if_mixed_precision(to_spox_var(x)))
+        return KeroxTensor(spox_var=sops.neg(sops.softplus(x)))
     return kops.log_sigmoid(x)
 
 
@@ -239,9 +241,12 @@ NAME_TO_FUNCTION = {obj.__name__: obj for obj in ALL_OBJECTS}
 NAME_TO_FUNCTION[None] = linear
 
 
-def get(name_or_callable: str | Callable):
+def get(name_or_callable: str | dict | Callable):
     if callable(name_or_callable):
         return name_or_callable
+    if isinstance(name_or_callable, dict):
+        # Serialized config, as found in saved models
+        return deserialize(name_or_callable)
 
     if name_or_callable not in NAME_TO_FUNCTION:
         raise ValueError(f"Unknown activation function: {name_or_callable}")
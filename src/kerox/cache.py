@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+from keras import saving
+
+from kerox import export, runtime
+from kerox.__about__ import __version__
+from kerox.core import KeroxTensor
+from kerox.ops.utils import ONNX_OPSET
+
+
+class ExportCache:
+    """On-disk cache of exported ONNX models with LRU size-based eviction.
+
+    Entries are keyed on everything that determines the exported graph: the
+    kerox version and ONNX opset, the model config, the input signature, the
+    export options and the contents of every weight. An unchanged model is
+    thus read back from disk instead of being traced and built again, while
+    any change to its architecture or weights results in a new export.
+
+    Subclassed models without a `get_config` are keyed on their class and the
+    configs of their layers, so changes to their `call` aren't detected.
+
+    Args:
+        directory: Directory holding the cached models. Created if missing.
+        max_size_bytes: Once the cached models take more than this, the least
+            recently used ones are evicted.
+    """
+
+    def __init__(self, directory: str | os.PathLike, max_size_bytes: int = 2**30):
+        self.directory = os.fspath(directory)
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, model, inputs=None, **export_kwargs) -> str:
+        """Hash identifying the export of `model` with the given options."""
+        if export_kwargs.get("external_data") is not None:
+            raise ValueError("Exports with external data can't be cached.")
+        if export_kwargs.get("preprocessing") is not None:
+            # Functions can close over constants their name doesn't identify
+            raise ValueError("Exports with preprocessing can't be cached.")
+        if inputs is None:
+            inputs = getattr(model, "inputs", None)
+        digest = hashlib.sha256()
+        header = {
+            "kerox": __version__,
+            "opset": ONNX_OPSET,
+            "model": model_config(model),
+            "inputs": input_signature(inputs) if inputs else None,
+            "export": canonical(export_kwargs),
+        }
+        digest.update(json.dumps(header, sort_keys=True).encode())
+        # One weight in memory at a time
+        for variable in model.weights:
+            value = np.ascontiguousarray(variable.numpy())
+            digest.update(f"{variable.path}:{value.dtype}:{value.shape}".encode())
+            digest.update(value.data)
+        return digest.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.onnx")
+
+    def get(self, key: str) -> Optional[onnx.ModelProto]:
+        """Cached model for `key`, or `None` if there is none."""
+        path = self.path(key)
+        try:
+            model_proto = onnx.load(path)
+        except FileNotFoundError:
+            return None
+        # Mark as recently used
+        os.utime(path)
+        return model_proto
+
+    def put(self, key: str, model_proto: onnx.ModelProto):
+        """Store `model_proto` under `key`, then evict to fit `max_size_bytes`."""
+        # Write to a temporary file first, so readers never see partial models
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(model_proto.SerializeToString())
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used models until the cache fits its size."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".onnx"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".onnx"):
+                os.remove(entry.path)
+
+    def build_onnx_model(self, model, inputs=None, **export_kwargs) -> onnx.ModelProto:
+        """Cached `kerox.export.build_onnx_model`.
+
+        Args:
+            model: A `KeroxModel`.
+            inputs: Symbolic inputs to trace the model with, if it has none.
+            **export_kwargs: Forwarded to `kerox.export.build_onnx_model`.
+
+        Returns:
+            The cached ONNX model if any, or the newly exported one.
+        """
+        key = self.key(model, inputs, **export_kwargs)
+        model_proto = self.get(key)
+        if model_proto is not None:
+            self.hits += 1
+            return model_proto
+        self.misses += 1
+        model_proto = export.build_onnx_model(model, inputs, **export_kwargs)
+        self.put(key, model_proto)
+        return model_proto
+
+    def make_inference_session(
+        self,
+        model,
+        inputs=None,
+        *,
+        session_kwargs: Optional[dict[str, Any]] = None,
+        **export_kwargs,
+    ) -> ort.InferenceSession:
+        """Inference session of the cached export of `model`.
+
+        `session_kwargs` are forwarded to `kerox.runtime.make_inference_session`.
+        """
+        model_proto = self.build_onnx_model(model, inputs, **export_kwargs)
+        return runtime.make_inference_session(model_proto, **(session_kwargs or {}))
+
+
+def model_config(model) -> Any:
+    try:
+        return canonical(saving.serialize_keras_object(model))
+    except NotImplementedError:
+        return {
+            "class": f"{type(model).__module__}.{type(model).__qualname__}",
+            "layers": [
+                canonical(saving.serialize_keras_object(layer))
+                for layer in model.layers
+            ],
+        }
+
+
+def input_signature(inputs: KeroxTensor | Sequence[KeroxTensor]) -> list:
+    return [
+        {
+            "shape": list(x.shape),
+            "dtype": str(x.dtype),
+            "dynamic_axes": sorted(x.dynamic_axes.items()),
+        }
+        for x in export.as_kerox_inputs(inputs)
+    ]
+
+
+def canonical(value: Any) -> Any:
+    """JSON-serializable and deterministic representation of `value`."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in sorted(value.items(), key=str)}
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return canonical(value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if callable(value) and hasattr(value, "__qualname__"):
+        return f"{value.__module__}.{value.__qualname__}"
+    if hasattr(value, "__dict__"):
+        return {
+            "class": f"{type(value).__module__}.{type(value).__qualname__}",
+            "attributes": canonical(
+                {k: v for k, v in vars(value).items() if not k.startswith("_")}
+            ),
+        }
+    return repr(value)
+
+
+__all__ = ["ExportCache"]
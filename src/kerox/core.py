@@ -1,9 +1,13 @@
-from typing import TYPE_CHECKING, Optional
+import threading
+import types
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import TYPE_CHECKING, Any, Hashable, Iterator, Optional
 
+import numpy as np
 import spox
 import spox._future
 from keras import KerasTensor
-from keras.src.backend.common import global_state
 
 from kerox.ops.utils import sops
 from kerox.typing import DTypeLike, ShapeLike
@@ -14,29 +18,212 @@ else:
     from keras import Variable as KerasVariable
 
 
+_onnx_build_scope: ContextVar[Optional["ONNXBuildScope"]] = ContextVar(
+    "kerox_onnx_build_scope", default=None
+)
+_backend_overrides: ContextVar[dict[str, Any]] = ContextVar(
+    "kerox_backend_overrides", default={}
+)
+_backend_proxy_lock = threading.Lock()
+
+
+class _BackendProxy(types.ModuleType):
+    """Stand-in for `keras.src.backend` in the namespace of a Keras module.
+
+    Attributes overridden through `override_backend` in the current context
+    take precedence over those of the backend, so Keras code creating a
+    `backend.Variable` or `backend.KerasTensor` creates the kerox class instead,
+    without altering the backend seen by other threads or tasks.
+    """
+
+    def __init__(self, backend: types.ModuleType):
+        super().__init__(backend.__name__, backend.__doc__)
+        self._backend = backend
+
+    def __getattr__(self, name: str) -> Any:
+        overrides = _backend_overrides.get()
+        if name in overrides:
+            return overrides[name]
+        return getattr(self._backend, name)
+
+
+@contextmanager
+def override_backend(module: types.ModuleType, **overrides: Any) -> Iterator[None]:
+    """Override attributes of the `backend` used by a Keras `module`.
+
+    The overrides only apply to the current thread or asyncio task.
+
+    Args:
+        module: Keras module that imports `keras.src.backend` as `backend`.
+        **overrides: Backend attributes to override, e.g. `Variable=...`.
+    """
+    if not isinstance(module.backend, _BackendProxy):
+        with _backend_proxy_lock:
+            if not isinstance(module.backend, _BackendProxy):
+                module.backend = _BackendProxy(module.backend)
+    token = _backend_overrides.set({**_backend_overrides.get(), **overrides})
+    try:
+        yield
+    finally:
+        _backend_overrides.reset(token)
+
+
+MIXED_PRECISION_DTYPES = ("float16", "bfloat16")
+
+
 class ONNXBuildScope:
-    def __enter__(self):
-        self._already_in_onnx_build = in_onnx_build_scope()
-        global_state.set_global_attribute("onnx_build", True)
+    """Scope in which kerox layers and ops emit spox nodes instead of Keras ops.
+
+    Nested scopes reuse the outermost one, which owns the state shared by the
+    whole build, such as the cache of spox vars created for each variable.
+    The active scope is context-local, so models can be exported concurrently
+    from different threads or asyncio tasks.
+
+    Args:
+        merge_lora: Whether LoRA enabled layers export their kernel with the
+            low-rank delta merged in as a single constant, instead of keeping the
+            adapters as separate weights combined at runtime.
+        use_gemm: Whether `Dense` layers applied on 2-D inputs are lowered to a
+            single `Gemm` node instead of `MatMul` followed by `Add`.
+        quantization: Optional `kerox.quantization.QuantizationConfig` with the
+            static INT8 parameters of the `Dense` layers to quantize.
+        external_data: Optional open `kerox.external_data.ExternalDataWriter`
+            weights are streamed to instead of being embedded in the graph.
+        mixed_precision: Optional half precision dtype, `"float16"` or
+            `"bfloat16"`, to store the `Dense` weights in. With `"float16"`
+            `Dense` layers also compute in half precision, while with
+            `"bfloat16"` the weights are cast back to float32 when loaded, since
+            spox can't express bfloat16 computations.
+        dropout_training: Optional boolean spox var, usually a graph input,
+            toggling every `Dropout` layer at run time regardless of the
+            `training` flag the model is traced with, for Monte-Carlo dropout.
+        name_prefix: Prefix of the names of the weights and nodes of the model,
+            so that several models traced into one graph don't clash.
+    """
+
+    def __init__(
+        self,
+        *,
+        merge_lora: bool = False,
+        use_gemm: bool = False,
+        quantization: Optional[Any] = None,
+        external_data: Optional[Any] = None,
+        mixed_precision: Optional[str] = None,
+        dropout_training: Optional[spox.Var] = None,
+        name_prefix: str = "",
+    ):
+        if mixed_precision not in (None, *MIXED_PRECISION_DTYPES):
+            raise ValueError(
+                f"Unknown mixed_precision: {mixed_precision}. "
+                f"Expected one of {list(MIXED_PRECISION_DTYPES)}"
+            )
+        self.merge_lora = merge_lora
+        self.use_gemm = use_gemm
+        self.quantization = quantization
+        self.external_data = external_data
+        self.mixed_precision = mixed_precision
+        self.dropout_training = dropout_training
+        self.name_prefix = name_prefix
+        # Paths of the weights to store in bfloat16 once the model is built
+        self.bfloat16_weights: set[str] = set()
+        self.spox_vars: dict[Hashable, spox.Var] = {}
+        # Node names, `{layer.path}/{op_type}_{i}`, keyed by their first output
+        self.node_names: dict[str, str] = {}
+        self._node_counts: dict[str, int] = {}
+        # One entry per `__enter__`, `None` when an outer scope was active
+        self._tokens: list[Optional[Token]] = []
+
+    def __enter__(self) -> "ONNXBuildScope":
+        parent_scope = get_onnx_build_scope()
+        if parent_scope is not None:
+            self._tokens.append(None)
+            return parent_scope
+        self._tokens.append(_onnx_build_scope.set(self))
+        return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if not self._already_in_onnx_build:
-            global_state.set_global_attribute("onnx_build", None)
+        token = self._tokens.pop()
+        if token is not None:
+            self.spox_vars.clear()
+            _onnx_build_scope.reset(token)
+
+    def tag_layer_nodes(
+        self, path: str, inputs: list[spox.Var], outputs: list[spox.Var]
+    ):
+        """Attribute the nodes computing `outputs` from `inputs` to layer `path`.
+
+        Their outputs are named `{path}/{op_type}_{i}_{field}` and the graph
+        nodes `{path}/{op_type}_{i}` once built. Layers are called innermost
+        first, so nodes already attributed to a nested layer keep its path.
+        """
+        path = self.name_prefix + path
+        boundary = {id(var) for var in inputs}
+        visited: set[int] = set()
+        stack = list(outputs)
+        while stack:
+            var = stack.pop()
+            if id(var) in boundary or id(var) in visited:
+                continue
+            visited.add(id(var))
+            node = var._op
+            unnamed = {
+                field: output
+                for field, output in node.outputs.get_vars().items()
+                if output._name is None
+            }
+            # Weights and graph inputs are already named
+            if unnamed:
+                op_type = node.op_type.identifier
+                count = self._node_counts.get(f"{path}/{op_type}", 0)
+                self._node_counts[f"{path}/{op_type}"] = count + 1
+                node_name = f"{path}/{op_type}_{count}"
+                for field, output in unnamed.items():
+                    output._rename(f"{node_name}_{field}")
+                    self.node_names[output._name] = node_name
+            stack.extend(node.inputs.get_vars().values())
+
+
+def get_onnx_build_scope() -> Optional[ONNXBuildScope]:
+    return _onnx_build_scope.get()
 
 
 def in_onnx_build_scope() -> bool:
-    return global_state.get_global_attribute("onnx_build", default=None) is not None
+    return get_onnx_build_scope() is not None
+
+
+def weight_var(name: str, value: np.ndarray, trainable: bool = True) -> spox.Var:
+    """Spox var holding a weight of the model, named `name` in the graph.
+
+    The name is prefixed with the `name_prefix` of the build scope, if any.
+
+    Trainable weights become initializers and the rest constants, unless the
+    build scope streams weights to external data, in which case all of them
+    become external initializers.
+    """
+    scope = get_onnx_build_scope()
+    if scope is not None:
+        name = scope.name_prefix + name
+        if scope.external_data is not None:
+            return scope.external_data.add(name, value)
+    if trainable:
+        # Allows training in onnxruntime for training
+        var = spox._future.initializer(value=value)
+    else:
+        # Don't risk using experimental feature if we are sure it's not trainable
+        var = sops.constant(value=value)
+    var._rename(name)
+    return var
 
 
 class KeroxVariable(KerasVariable):
     def spox_var(self) -> spox.Var:
-        if self.trainable:
-            # Allows training in onnxruntime for training
-            var = spox._future.initializer(value=self.numpy())
-        else:
-            # Don't risk using experimental feature if we are sure it's not trainable
-            var = sops.constant(value=self.numpy())
-        var._rename(self.path)
+        # Each variable becomes a single initializer, however many times it is used
+        scope = get_onnx_build_scope()
+        if scope is not None and id(self) in scope.spox_vars:
+            return scope.spox_vars[id(self)]
+        var = weight_var(self.path, self.numpy(), trainable=self.trainable)
+        if scope is not None:
+            scope.spox_vars[id(self)] = var
         return var
 
     def __repr__(self):
@@ -44,12 +231,28 @@ class KeroxVariable(KerasVariable):
 
 
 class KeroxTensor(KerasTensor):
+    """Symbolic tensor that becomes a spox var when building the ONNX model.
+
+    Args:
+        shape: Shape of the tensor. `None` and string entries are unknown
+            dimensions, the latter named after the string.
+        dtype: Data type of the tensor.
+        spox_var: Existing spox var the tensor stands for, whose type gives the
+            shape and dtype of the tensor.
+        name: Name of the tensor, used for the ONNX graph input it becomes.
+        dynamic_axes: Symbolic names of unknown dimensions, keyed by axis (e.g.
+            `{0: "batch"}`). Axes that get the same name must be equal at
+            runtime, which ONNX shape inference propagates through the graph.
+            A named axis is unknown even if `shape` gives it a fixed size.
+    """
+
     def __init__(
         self,
         shape: Optional[ShapeLike] = None,
         dtype: DTypeLike = "float32",
         spox_var: Optional[spox.Var] = None,
         name: Optional[str] = None,
+        dynamic_axes: Optional[dict[int, str]] = None,
         **kwargs,
     ):
         if spox_var is not None:
@@ -58,18 +261,39 @@ class KeroxTensor(KerasTensor):
         else:
             if shape is None:
                 raise ValueError("shape must be provided if spox_var is not.")
+        shape = tuple(shape)
+        self.dynamic_axes = {
+            axis: dim for axis, dim in enumerate(shape) if isinstance(dim, str)
+        }
+        for axis, dim in (dynamic_axes or {}).items():
+            if not -len(shape) <= axis < len(shape):
+                raise ValueError(
+                    f"Dynamic axis {axis} is out of range for shape {shape}."
+                )
+            self.dynamic_axes[axis % len(shape)] = dim
+        # Keras only knows about unknown dimensions, not about their names
+        shape = tuple(
+            None if axis in self.dynamic_axes else dim for axis, dim in enumerate(shape)
+        )
         self._spox_var = spox_var
         super().__init__(shape, dtype, name=name, **kwargs)
 
+    @property
+    def onnx_shape(self) -> tuple[int | str | None, ...]:
+        """Shape of the tensor with unknown dimensions replaced by their names."""
+        return tuple(
+            self.dynamic_axes.get(axis, dim) for axis, dim in enumerate(self.shape)
+        )
+
     def spox_var(self) -> spox.Var:
         if self._spox_var is not None:
             return self._spox_var
-        var = spox.argument(spox.Tensor(self.dtype, self.shape))
+        var = spox.argument(spox.Tensor(self.dtype, self.onnx_shape))
         var._rename(self.name)
         self._spox_var = var
         return var
 
     def __repr__(self):
         return "<KeroxTensor: shape={}, dtype={}, name={}>".format(
-            self.shape, self.dtype, self.name
+            self.onnx_shape, self.dtype, self.name
         )
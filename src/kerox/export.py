@@ -0,0 +1,819 @@
+import contextlib
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional, Sequence
+
+import numpy as np
+import onnx
+import spox
+from keras import KerasTensor, ops, saving, tree
+from onnx import numpy_helper
+
+from kerox import optimize as graph_optimization
+from kerox.core import KeroxTensor, ONNXBuildScope
+from kerox.external_data import ExternalDataWriter
+from kerox.ops.utils import sops as spox_ops
+from kerox.ops.utils import to_spox_var
+
+# Boolean graph input toggling dropout in Monte-Carlo dropout exports
+MC_DROPOUT_INPUT = "dropout"
+# Dtypes float weights may be exported in
+FLOAT_TENSOR_TYPES = (
+    onnx.TensorProto.FLOAT,
+    onnx.TensorProto.FLOAT16,
+    onnx.TensorProto.BFLOAT16,
+    onnx.TensorProto.DOUBLE,
+)
+# Ways to combine the outputs of the models of an ensemble
+ENSEMBLE_REDUCTIONS = ("mean", "weighted", "stack")
+
+
+def as_kerox_inputs(
+    inputs: KeroxTensor | Sequence[KeroxTensor],
+) -> list[KeroxTensor]:
+    """Flatten `inputs` into a list of `KeroxTensor`.
+
+    Plain `KerasTensor` (e.g. inputs of a `KeroxSequential` built without an
+    `InputLayer`) are replaced by an equivalent `KeroxTensor`.
+    """
+    converted = []
+    for x in tree.flatten(inputs):
+        if not isinstance(x, KerasTensor):
+            raise ValueError(f"Expected symbolic tensors as inputs, but got {x}")
+        if not isinstance(x, KeroxTensor):
+            x = KeroxTensor(shape=x.shape, dtype=x.dtype, name=x.name)
+        converted.append(x)
+    return converted
+
+
+def io_names(prefix: str, count: int) -> list[str]:
+    if count == 1:
+        return [prefix]
+    return [f"{prefix}_{i}" for i in range(count)]
+
+
+def symbolic_inputs(
+    inputs: Sequence[KeroxTensor],
+    dynamic_axes: Optional[dict[str, dict[int, str]]] = None,
+    batch_dim: Optional[str] = "batch",
+) -> list[KeroxTensor]:
+    """Fresh copies of `inputs` with the symbolic dimensions of the export.
+
+    Args:
+        inputs: The symbolic inputs of the model.
+        dynamic_axes: Names of symbolic dimensions keyed by graph input name and
+            axis, e.g. `{"input": {1: "sequence"}}`. They take precedence over
+            the `dynamic_axes` of the inputs themselves.
+        batch_dim: Name of the leading dimension of inputs whose batch size is
+            unknown, so all inputs and outputs share it. If `None`, each of
+            them gets its own anonymous dimension.
+    """
+    dynamic_axes = dynamic_axes or {}
+    names = io_names("input", len(inputs))
+    unknown_names = set(dynamic_axes) - set(names)
+    if unknown_names:
+        raise ValueError(
+            f"Got dynamic axes for unknown inputs {sorted(unknown_names)}, "
+            f"inputs are {names}."
+        )
+    copies = []
+    for name, x in zip(names, inputs):
+        axes = {}
+        if batch_dim is not None and x.shape and x.shape[0] is None:
+            axes[0] = batch_dim
+        axes.update(x.dynamic_axes)
+        axes.update(dynamic_axes.get(name, {}))
+        copies.append(
+            KeroxTensor(shape=x.shape, dtype=x.dtype, name=x.name, dynamic_axes=axes)
+        )
+    return copies
+
+
+def build_onnx_model(
+    model,
+    inputs: Optional[KeroxTensor | Sequence[KeroxTensor]] = None,
+    *,
+    training: bool = False,
+    merge_lora: Optional[bool] = None,
+    use_gemm: bool = True,
+    quantization=None,
+    optimize: bool | Sequence[graph_optimization.GraphPass] = True,
+    dynamic_axes: Optional[dict[str, dict[int, str]]] = None,
+    batch_dim: Optional[str] = "batch",
+    external_data: Optional[str | os.PathLike] = None,
+    mixed_precision: Optional[str] = None,
+    mc_dropout_samples: Optional[int] = None,
+    preprocessing: Optional[Callable] = None,
+    raw_inputs: Optional[KeroxTensor | Sequence[KeroxTensor]] = None,
+) -> onnx.ModelProto:
+    """Trace `model` in ONNX build scope and build an ONNX model out of it.
+
+    Args:
+        model: A `KeroxModel` (functional, sequential or subclassed).
+        inputs: Symbolic inputs to trace the model with. Defaults to
+            `model.inputs`, which is only available for functional and
+            sequential models.
+        training: Whether to trace the model in training mode.
+        merge_lora: Whether to merge LoRA adapters into their kernels at export
+            time. Defaults to `not training`, so inference graphs don't recompute
+            the low-rank delta on every call while exports meant for on-device
+            fine-tuning keep the adapters separate.
+        use_gemm: Whether to lower `Dense` layers on 2-D inputs to a single
+            `Gemm` node. ONNX Runtime further fuses it with a following
+            activation into `FusedGemm` at the `"extended"` optimization level
+            and above. Inputs of higher rank always use `MatMul` and `Add`.
+        quantization: Optional `kerox.quantization.QuantizationConfig`. See
+            `kerox.quantization.quantize`, which calibrates and builds it.
+        optimize: Whether to run `kerox.optimize.DEFAULT_PASSES` over the built
+            graph (constant folding, deduplication of constants, common
+            subexpression and `Identity` elimination, `MatMul`+`Add` fusion), or
+            the sequence of graph passes to run instead.
+        dynamic_axes: Names of symbolic input dimensions keyed by graph input
+            name and axis, e.g. `{"input": {0: "batch", 1: "sequence"}}`. Named
+            axes are exported as symbolic even if the inputs give them a size,
+            and override the `dynamic_axes` of `KeroxInput`.
+        batch_dim: Name of the leading dimension of the inputs with an unknown
+            batch size. ONNX shape inference carries it over to the outputs, so
+            the model declares that they all share the same batch size. If
+            `None`, unknown dimensions are left anonymous.
+        external_data: Optional path of a file to stream the weights to while
+            tracing, so they are neither duplicated in memory nor subject to the
+            2 GB protobuf limit. Initializers then reference their offset in the
+            file, and the model must be saved in the same directory. See
+            `kerox.runtime.make_inference_session` to memory-map them.
+        mixed_precision: Optional half precision dtype to store the `Dense`
+            weights in, halving their size. With `"float16"`, `Dense` layers and
+            the activations following them also compute in float16, except for
+            `softmax`, `log_softmax` and `log_sigmoid` which compute in float32,
+            and float16 outputs are cast back to float32. With `"bfloat16"`,
+            weights are cast to float32 when the model is loaded and computations
+            stay in float32, since ONNX Runtime has no bfloat16 CPU kernels.
+        mc_dropout_samples: Optional number of Monte-Carlo dropout samples. The
+            graph then repeats the batch this many times, runs it with every
+            `Dropout` layer active, so each repetition gets its own masks, and
+            returns the mean and variance of each output over the samples.
+            Dropout is toggled by a boolean graph input named `dropout`, which
+            defaults to `True`.
+        preprocessing: Optional function fused in front of the model, taking
+            one `ndonnx.Array` per raw input and returning the arrays to feed to
+            the model inputs, cast to their dtype if needed. Standardization,
+            clipping, one-hot encoding or imputation then run in the same
+            ONNX Runtime call as the model.
+        raw_inputs: Symbolic inputs of `preprocessing`, which become the graph
+            inputs, e.g. `KeroxInput(shape=(3,), dtype="int64")`. Required with
+            `preprocessing`.
+
+    Returns:
+        The ONNX model. Graph inputs are named `input` (or `input_{i}` if there
+        are several) and graph outputs `output` (or `output_{i}`). With
+        `mc_dropout_samples`, outputs are named `mean` and `variance` (or
+        `mean_{i}` and `variance_{i}`) instead.
+    """
+    if inputs is None:
+        inputs = getattr(model, "inputs", None)
+        if not inputs:
+            raise ValueError(
+                "Model has no symbolic inputs, pass `inputs` to trace it with "
+                "(e.g. `KeroxInput(shape=...)`)."
+            )
+    if preprocessing is not None:
+        if raw_inputs is None:
+            raise ValueError("Pass the `raw_inputs` taken by `preprocessing`.")
+        # Trace with copies, so each export gets its own graph inputs
+        graph_tensors = symbolic_inputs(
+            as_kerox_inputs(raw_inputs), dynamic_axes, batch_dim
+        )
+        inputs = preprocess(preprocessing, graph_tensors, as_kerox_inputs(inputs))
+    elif raw_inputs is not None:
+        raise ValueError("`raw_inputs` are only used with `preprocessing`.")
+    else:
+        inputs = symbolic_inputs(as_kerox_inputs(inputs), dynamic_axes, batch_dim)
+        graph_tensors = inputs
+    if merge_lora is None:
+        merge_lora = not training
+    dropout_training = None
+    if mc_dropout_samples is not None:
+        if mc_dropout_samples < 1:
+            raise ValueError(
+                f"mc_dropout_samples must be positive, got {mc_dropout_samples}"
+            )
+        if training:
+            raise ValueError("Monte-Carlo dropout can't be exported in training mode.")
+        dropout_training = spox.argument(spox.Tensor(np.bool_, ()))
+        dropout_training._rename(MC_DROPOUT_INPUT)
+    if mixed_precision == "bfloat16" and external_data is not None:
+        raise ValueError("bfloat16 mixed precision doesn't support external data.")
+    writer = (
+        ExternalDataWriter(external_data)
+        if external_data is not None
+        else contextlib.nullcontext()
+    )
+    with (
+        writer as writer,
+        ONNXBuildScope(
+            merge_lora=merge_lora,
+            use_gemm=use_gemm,
+            quantization=quantization,
+            external_data=writer,
+            mixed_precision=mixed_precision,
+            dropout_training=dropout_training,
+        ) as scope,
+    ):
+        call_args = inputs
+        if mc_dropout_samples is not None:
+            call_args = [repeat_batch(x, mc_dropout_samples) for x in inputs]
+        call_args = call_args[0] if len(call_args) == 1 else call_args
+        outputs = tree.flatten(model.onnx_symbolic_call(call_args, training=training))
+        bfloat16_weights = set(scope.bfloat16_weights)
+        node_names = dict(scope.node_names)
+    if mixed_precision is not None:
+        outputs = [
+            KeroxTensor(spox_var=spox_ops.cast(y.spox_var(), to=np.float32))
+            if y.spox_var().unwrap_tensor().dtype == np.float16
+            else y
+            for y in outputs
+        ]
+    graph_inputs = dict(
+        zip(
+            io_names("input", len(graph_tensors)),
+            (x.spox_var() for x in graph_tensors),
+        )
+    )
+    output_names = io_names("output", len(outputs))
+    if mc_dropout_samples is not None:
+        graph_inputs[MC_DROPOUT_INPUT] = dropout_training
+        output_names = [
+            name
+            for names in zip(
+                io_names("mean", len(outputs)), io_names("variance", len(outputs))
+            )
+            for name in names
+        ]
+        outputs = [
+            moment for y in outputs for moment in sample_moments(y, mc_dropout_samples)
+        ]
+    model_proto = spox.build(
+        # Weights streamed to external data are placeholder inputs until finalized
+        inputs={**graph_inputs, **(writer.arguments if writer else {})},
+        outputs=dict(zip(output_names, (y.spox_var() for y in outputs))),
+    )
+    if writer is not None:
+        model_proto = writer.finalize(model_proto)
+    name_layer_nodes(model_proto, node_names)
+    if optimize is not False:
+        passes = None if optimize is True else optimize
+        model_proto = graph_optimization.optimize(model_proto, passes)
+    if mc_dropout_samples is not None:
+        # An initializer named after a graph input is its default value, added
+        # after the passes so they don't take it for a constant
+        model_proto.graph.initializer.append(
+            numpy_helper.from_array(np.array(True), MC_DROPOUT_INPUT)
+        )
+    if mixed_precision == "float16":
+        pack_float16_weights(model_proto)
+    # After the passes, which would fold the casts of constant weights back
+    if bfloat16_weights:
+        # Including the constants the weights may have been folded into
+        names = [init.name for init in model_proto.graph.initializer]
+        names += [output for node in model_proto.graph.node for output in node.output]
+        bfloat16_weights |= graph_optimization.folded_weights(names, bfloat16_weights)
+        model_proto = store_as_bfloat16(model_proto, bfloat16_weights)
+    return model_proto
+
+
+def build_ensemble_model(
+    models: Sequence,
+    inputs: Optional[KeroxTensor | Sequence[KeroxTensor]] = None,
+    *,
+    reduction: str = "mean",
+    weights: Optional[Sequence[float]] = None,
+    prefixes: Optional[Sequence[str]] = None,
+    merge_lora: bool = True,
+    use_gemm: bool = True,
+    optimize: bool | Sequence[graph_optimization.GraphPass] = True,
+    dynamic_axes: Optional[dict[str, dict[int, str]]] = None,
+    batch_dim: Optional[str] = "batch",
+) -> onnx.ModelProto:
+    """Trace several models on the same inputs into a single ONNX model.
+
+    Each model becomes an independent branch of the graph reading the shared
+    graph inputs, so an ensemble is served with one session call, and ONNX
+    Runtime runs the branches concurrently with `execution_mode="parallel"`.
+    The weights and nodes of each model are named after its prefix, e.g.
+    `model_0/dense/kernel`.
+
+    Args:
+        models: The `KeroxModel`s to ensemble, all taking the same inputs and
+            returning the same number of outputs.
+        inputs: Symbolic inputs to trace the models with. Defaults to the
+            `inputs` of the first model.
+        reduction: How the outputs of the models are combined: `"mean"`,
+            `"weighted"` for their sum weighted by `weights`, or `"stack"` to
+            stack them along a new axis after the batch one.
+        weights: Weight of each model, required by the `"weighted"` reduction.
+        prefixes: Distinct name prefix of each model. Defaults to `model_{i}`.
+        merge_lora: Whether to merge LoRA adapters into their kernels.
+        use_gemm: Whether to lower `Dense` layers on 2-D inputs to `Gemm`.
+        optimize: Whether to run the default graph passes of
+            `kerox.optimize` over the exported graph, or the passes to run.
+        dynamic_axes: Names of symbolic input dimensions keyed by graph input
+            name and axis, see `build_onnx_model`.
+        batch_dim: Name of the leading dimension of inputs with an unknown
+            batch size, or `None` to leave it anonymous.
+
+    Returns:
+        The ONNX model, with inputs and outputs named as by `build_onnx_model`.
+    """
+    if not models:
+        raise ValueError("Expected at least one model to ensemble.")
+    if reduction not in ENSEMBLE_REDUCTIONS:
+        raise ValueError(
+            f"Unknown reduction: {reduction}. "
+            f"Expected one of {list(ENSEMBLE_REDUCTIONS)}"
+        )
+    if reduction == "weighted":
+        if weights is None or len(weights) != len(models):
+            raise ValueError(
+                f"The weighted reduction expects one weight per model, but got "
+                f"{weights} for {len(models)} models."
+            )
+    elif weights is not None:
+        raise ValueError("`weights` are only used with the weighted reduction.")
+    if prefixes is None:
+        prefixes = [f"model_{i}" for i in range(len(models))]
+    if len(prefixes) != len(models) or len(set(prefixes)) != len(prefixes):
+        raise ValueError(
+            f"Expected a distinct prefix for each of the {len(models)} models, "
+            f"but got {list(prefixes)}"
+        )
+    if inputs is None:
+        inputs = getattr(models[0], "inputs", None)
+        if not inputs:
+            raise ValueError(
+                "Model has no symbolic inputs, pass `inputs` to trace it with "
+                "(e.g. `KeroxInput(shape=...)`)."
+            )
+    signature = as_kerox_inputs(inputs)
+    # Shared by all models, so each graph input is read by every branch
+    inputs = symbolic_inputs(signature, dynamic_axes, batch_dim)
+    call_args = inputs[0] if len(inputs) == 1 else inputs
+    model_outputs = []
+    node_names = {}
+    for model, prefix in zip(models, prefixes):
+        model_inputs = getattr(model, "inputs", None)
+        if model_inputs:
+            check_ensemble_inputs(prefix, as_kerox_inputs(model_inputs), signature)
+        with ONNXBuildScope(
+            merge_lora=merge_lora, use_gemm=use_gemm, name_prefix=f"{prefix}/"
+        ) as scope:
+            model_outputs.append(tree.flatten(model.onnx_symbolic_call(call_args)))
+            node_names.update(scope.node_names)
+    num_outputs = {len(outputs) for outputs in model_outputs}
+    if len(num_outputs) != 1:
+        raise ValueError(
+            "Ensembled models must return the same number of outputs, but got "
+            f"{[len(outputs) for outputs in model_outputs]}."
+        )
+    outputs = [
+        reduce_ensemble(list(branches), reduction, weights)
+        for branches in zip(*model_outputs)
+    ]
+    model_proto = spox.build(
+        inputs=dict(
+            zip(io_names("input", len(inputs)), (x.spox_var() for x in inputs))
+        ),
+        outputs=dict(
+            zip(io_names("output", len(outputs)), (y.spox_var() for y in outputs))
+        ),
+    )
+    name_layer_nodes(model_proto, node_names)
+    if optimize is not False:
+        passes = None if optimize is True else optimize
+        model_proto = graph_optimization.optimize(model_proto, passes)
+    return model_proto
+
+
+def check_ensemble_inputs(
+    prefix: str, model_inputs: list[KeroxTensor], inputs: list[KeroxTensor]
+):
+    """Raise if the inputs of the model `prefix` don't match the ensemble ones.
+
+    Dimensions unknown on either side match any size.
+    """
+    if len(model_inputs) != len(inputs):
+        raise ValueError(
+            f"Model {prefix} takes {len(model_inputs)} inputs, "
+            f"but the ensemble has {len(inputs)}."
+        )
+    for i, (model_input, x) in enumerate(zip(model_inputs, inputs)):
+        compatible = (
+            model_input.dtype == x.dtype
+            and len(model_input.shape) == len(x.shape)
+            and all(
+                a is None or b is None or a == b
+                for a, b in zip(model_input.shape, x.shape)
+            )
+        )
+        if not compatible:
+            raise ValueError(
+                f"Input {i} of model {prefix} has shape {model_input.shape} and "
+                f"dtype {model_input.dtype}, but the ensemble input has shape "
+                f"{x.shape} and dtype {x.dtype}."
+            )
+
+
+def reduce_ensemble(
+    outputs: list[KeroxTensor],
+    reduction: str,
+    weights: Optional[Sequence[float]] = None,
+) -> KeroxTensor:
+    """Combine the outputs of each model of an ensemble into one output."""
+    vars = [y.spox_var() for y in outputs]
+    if reduction == "stack":
+        axes = spox_ops.constant(value=np.array([1], dtype=np.int64))
+        stacked = [spox_ops.unsqueeze(var, axes) for var in vars]
+        return KeroxTensor(spox_var=spox_ops.concat(stacked, axis=1))
+    if reduction == "weighted":
+        dtype = vars[0].unwrap_tensor().dtype
+        vars = [
+            spox_ops.mul(var, spox_ops.constant(value=np.array(weight, dtype=dtype)))
+            for var, weight in zip(vars, weights)
+        ]
+        return KeroxTensor(spox_var=spox_ops.sum(vars))
+    return KeroxTensor(spox_var=spox_ops.mean(vars))
+
+
+def preprocess(
+    preprocessing: Callable,
+    raw_inputs: Sequence[KeroxTensor],
+    model_inputs: Sequence[KeroxTensor],
+) -> list[KeroxTensor]:
+    """Trace the ndonnx function `preprocessing` into the model inputs.
+
+    Args:
+        preprocessing: Function of one `ndonnx.Array` per raw input, returning
+            one array per model input.
+        raw_inputs: Symbolic raw inputs, the graph inputs.
+        model_inputs: Symbolic inputs of the model, for their dtype and rank.
+
+    Returns:
+        The preprocessed tensors to call the model with.
+    """
+    # Only exports with preprocessing pay for importing ndonnx
+    import ndonnx
+
+    arrays = [ndonnx.from_spox_var(x.spox_var()) for x in raw_inputs]
+    outputs = tree.flatten(preprocessing(*arrays))
+    if len(outputs) != len(model_inputs):
+        raise ValueError(
+            f"Preprocessing returned {len(outputs)} arrays, but the model has "
+            f"{len(model_inputs)} inputs."
+        )
+    tensors = []
+    for i, (output, x) in enumerate(zip(outputs, model_inputs)):
+        var = to_spox_var(output)
+        tensor_type = var.unwrap_tensor()
+        if tensor_type.shape is not None and len(tensor_type.shape) != len(x.shape):
+            raise ValueError(
+                f"Preprocessing returned an array of rank {len(tensor_type.shape)} "
+                f"for model input {i} of shape {x.shape}."
+            )
+        if tensor_type.dtype != np.dtype(x.dtype):
+            var = spox_ops.cast(var, to=np.dtype(x.dtype))
+        tensors.append(KeroxTensor(spox_var=var))
+    return tensors
+
+
+def repeat_batch(x: KeroxTensor, repeats: int) -> KeroxTensor:
+    """Tile `x` `repeats` times along its leading, batch, axis."""
+    tiles = np.ones(len(x.shape), dtype=np.int64)
+    tiles[0] = repeats
+    var = spox_ops.tile(x.spox_var(), spox_ops.constant(value=tiles))
+    return KeroxTensor(spox_var=var)
+
+
+def sample_moments(y: KeroxTensor, num_samples: int) -> list[KeroxTensor]:
+    """Mean and variance over the samples of `y`, computed for a tiled batch.
+
+    `y` holds the `num_samples` samples of each element of the batch, stacked
+    along its leading axis as laid out by `repeat_batch`.
+    """
+    var = y.spox_var()
+    # (num_samples * batch, ...) -> (num_samples, batch, ...)
+    shape = spox_ops.concat(
+        [
+            spox_ops.constant(value=np.array([num_samples, -1], dtype=np.int64)),
+            spox_ops.shape(var, start=1),
+        ],
+        axis=0,
+    )
+    samples = spox_ops.reshape(var, shape)
+    axes = spox_ops.constant(value=np.array([0], dtype=np.int64))
+    mean = spox_ops.reduce_mean(samples, axes, keepdims=0)
+    deviation = spox_ops.sub(samples, mean)
+    variance = spox_ops.reduce_mean(
+        spox_ops.mul(deviation, deviation), axes, keepdims=0
+    )
+    return [KeroxTensor(spox_var=mean), KeroxTensor(spox_var=variance)]
+
+
+def name_layer_nodes(model_proto: onnx.ModelProto, node_names: dict[str, str]):
+    """Name the nodes emitted by layers after them, see `tag_layer_nodes`."""
+    for node in model_proto.graph.node:
+        name = next((node_names[o] for o in node.output if o in node_names), None)
+        if name is not None:
+            node.name = name
+
+
+def store_as_bfloat16(model_proto: onnx.ModelProto, names: set[str]) -> onnx.ModelProto:
+    """Store the float32 weights `names` in bfloat16, cast to float32 on load.
+
+    Weights keep their name, only their consumers read the cast instead.
+    """
+    graph = model_proto.graph
+    renames: dict[str, str] = {}
+    casts = []
+
+    def cast_to_float32(name: str) -> onnx.NodeProto:
+        renames[name] = f"{name}/float32"
+        return onnx.helper.make_node(
+            "Cast", [name], [renames[name]], to=onnx.TensorProto.FLOAT
+        )
+
+    for tensor in graph.initializer:
+        if tensor.name in names and tensor.data_type == onnx.TensorProto.FLOAT:
+            to_bfloat16(tensor)
+            casts.append(cast_to_float32(tensor.name))
+    new_nodes = list(casts)
+    for node in graph.node:
+        new_nodes.append(node)
+        if (
+            graph_optimization.is_constant_node(node)
+            and node.output[0] in names
+            and node.attribute[0].t.data_type == onnx.TensorProto.FLOAT
+        ):
+            to_bfloat16(node.attribute[0].t)
+            new_nodes.append(cast_to_float32(node.output[0]))
+    # Before adding the casts, which must still read the weights themselves
+    graph_optimization.rename_inputs(graph, renames)
+    graph_optimization.replace_nodes(graph, new_nodes)
+    return model_proto
+
+
+def pack_float16_weights(model_proto: onnx.ModelProto):
+    """Store float16 weights as raw bytes, instead of one int32 per value."""
+    tensors = [*model_proto.graph.initializer] + [
+        node.attribute[0].t
+        for node in model_proto.graph.node
+        if graph_optimization.is_constant_node(node)
+    ]
+    for tensor in tensors:
+        if tensor.data_type == onnx.TensorProto.FLOAT16 and tensor.int32_data:
+            tensor.CopyFrom(
+                numpy_helper.from_array(numpy_helper.to_array(tensor), tensor.name)
+            )
+
+
+def to_bfloat16(tensor: onnx.TensorProto):
+    """Convert a float32 `TensorProto` to bfloat16 in place, rounding to nearest even."""
+    bits = numpy_helper.to_array(tensor).astype(np.float32).view(np.uint32)
+    bits = bits.astype(np.uint64)
+    rounded = ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+    tensor.ClearField("float_data")
+    tensor.data_type = onnx.TensorProto.BFLOAT16
+    tensor.raw_data = rounded.tobytes()
+
+
+def refresh_weights(
+    model_proto: onnx.ModelProto, model, *, prefix: str = ""
+) -> onnx.ModelProto:
+    """Replace the weights of an exported model by the current ones of `model`.
+
+    Retrained models with an unchanged architecture are refreshed without
+    tracing them again: each weight of the graph, an initializer or a
+    `Constant` node named after the path of its variable, gets the current
+    value of the variable, stored in the dtype it was exported in. Kernels
+    exported with their LoRA adapters merged get the merged value, and
+    `BatchNormalization` layers their scale and shift.
+    Non-trainable weights are only found if the optimization passes didn't
+    fold or merge their constants.
+
+    Args:
+        model_proto: Model exported from `model`, or from a model of the same
+            architecture, updated in place.
+        model: The `KeroxModel` holding the new weights.
+        prefix: Name prefix of the weights of `model` in the graph, e.g.
+            `"model_0/"` for the first model of an ensemble.
+
+    Returns:
+        `model_proto`, with the new weights.
+    """
+    graph = model_proto.graph
+    tensors = {tensor.name: tensor for tensor in graph.initializer}
+    tensors.update(
+        (node.output[0], node.attribute[0].t)
+        for node in graph.node
+        if graph_optimization.is_constant_node(node)
+    )
+    values = {}
+    for layer in model._flatten_layers(include_self=False):
+        lora_enabled = getattr(layer, "lora_enabled", False)
+        if lora_enabled and prefix + layer.lora_kernel_a.path not in tensors:
+            values[prefix + layer._kernel.path] = ops.convert_to_numpy(
+                layer._get_kernel_with_merged_lora()
+            )
+            values[prefix + layer.lora_kernel_a.path] = None
+            values[prefix + layer.lora_kernel_b.path] = None
+        # Inference mode batch normalization exports its scale and shift only
+        scale_and_shift = getattr(layer, "scale_and_shift", None)
+        if scale_and_shift is not None and f"{prefix}{layer.path}/scale" in tensors:
+            scale, shift = scale_and_shift()
+            values[f"{prefix}{layer.path}/scale"] = scale
+            values[f"{prefix}{layer.path}/shift"] = shift
+            values.update((prefix + variable.path, None) for variable in layer.weights)
+    for variable in model.weights:
+        values.setdefault(prefix + variable.path, variable.numpy())
+    missing = [
+        name
+        for name, value in values.items()
+        if value is not None and name not in tensors
+    ]
+    if graph_optimization.folded_weights(tensors, set(missing)):
+        raise ValueError(
+            f"Weights {missing} were folded by `kerox.optimize.fold_scale_shift`, "
+            "so they can't be refreshed. Export the model without that pass, "
+            "for example with `optimize=False`."
+        )
+    if missing:
+        raise ValueError(
+            f"Weights {missing} aren't in the exported graph. It must be exported "
+            "from a model of the same architecture, and with `optimize=False` "
+            "if it has non-trainable weights, whose constants the optimization "
+            "passes may fold or merge."
+        )
+    values = {name: value for name, value in values.items() if value is not None}
+    # Checked before replacing any, so a failed refresh leaves the model as is
+    for name, value in values.items():
+        tensor = tensors[name]
+        if tuple(tensor.dims) != value.shape:
+            raise ValueError(
+                f"Weight {name} has shape {value.shape}, but {tuple(tensor.dims)} "
+                "in the exported graph."
+            )
+        if tensor.data_location == onnx.TensorProto.EXTERNAL:
+            raise ValueError(f"Weight {name} is stored as external data.")
+        if (
+            np.issubdtype(value.dtype, np.floating)
+            and tensor.data_type not in FLOAT_TENSOR_TYPES
+        ):
+            raise ValueError(f"Weight {name} is quantized, export the model again.")
+    for name, value in values.items():
+        tensor = tensors[name]
+        if tensor.data_type == onnx.TensorProto.BFLOAT16:
+            tensor.CopyFrom(numpy_helper.from_array(value.astype(np.float32), name))
+            to_bfloat16(tensor)
+        else:
+            dtype = onnx.helper.tensor_dtype_to_np_dtype(tensor.data_type)
+            tensor.CopyFrom(numpy_helper.from_array(value.astype(dtype), name))
+    return model_proto
+
+
+class ExportResult:
+    """Outcome of exporting one saved model with `export_many`.
+
+    Args:
+        model_path: Path of the saved Keras model.
+        onnx_path: Path the ONNX model was written to.
+        load_time_s: Seconds spent loading the saved model.
+        export_time_s: Seconds spent tracing, building and writing the model.
+        error: Formatted traceback if the export failed, `None` otherwise.
+    """
+
+    def __init__(
+        self,
+        model_path: str,
+        onnx_path: str,
+        load_time_s: float = 0.0,
+        export_time_s: float = 0.0,
+        error: Optional[str] = None,
+    ):
+        self.model_path = model_path
+        self.onnx_path = onnx_path
+        self.load_time_s = load_time_s
+        self.export_time_s = export_time_s
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __repr__(self):
+        status = "ok" if self.ok else "failed"
+        return (
+            f"<ExportResult: model_path={self.model_path}, {status}, "
+            f"load_time_s={self.load_time_s:.3f}, "
+            f"export_time_s={self.export_time_s:.3f}>"
+        )
+
+
+def export_many(
+    model_paths: Sequence[str | os.PathLike],
+    output_dir: Optional[str | os.PathLike] = None,
+    *,
+    max_workers: Optional[int] = None,
+    **export_kwargs,
+) -> list[ExportResult]:
+    """Export saved Kerox models to ONNX concurrently in a pool of processes.
+
+    Each worker process imports Keras and kerox once, when it starts, and then
+    loads (`keras.saving.load_model`), exports and writes as many models as it
+    is handed. Failures are reported per model instead of being raised.
+
+    Args:
+        model_paths: Paths of `.keras` files saved from `KeroxModel`s.
+        output_dir: Directory to write the ONNX models to, named after the saved
+            models with an `.onnx` suffix. Defaults to next to each saved model.
+        max_workers: Number of worker processes. Defaults to the number of CPUs.
+        **export_kwargs: Forwarded to `build_onnx_model`. They must be picklable.
+            Since the models can't share a data file, `external_data=True`
+            streams the weights of each to `{stem}.onnx.data` next to it.
+
+    Returns:
+        One `ExportResult` per model, in the order of `model_paths`.
+    """
+    external_data = export_kwargs.pop("external_data", None)
+    if external_data not in (None, False, True):
+        raise ValueError(
+            "`export_many` writes one external data file per model, pass "
+            "`external_data=True` instead of a path."
+        )
+    jobs = []
+    for model_path in map(os.fspath, model_paths):
+        stem = os.path.splitext(os.path.basename(model_path))[0]
+        directory = os.path.dirname(model_path) if output_dir is None else output_dir
+        jobs.append((model_path, os.path.join(directory, f"{stem}.onnx")))
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    if not jobs:
+        return []
+
+    # Spawned workers don't inherit the (possibly multithreaded) parent state
+    with ProcessPoolExecutor(
+        max_workers=min(max_workers or os.cpu_count() or 1, len(jobs)),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_export_worker,
+    ) as executor:
+        futures = [
+            executor.submit(
+                _export_saved_model,
+                model_path,
+                onnx_path,
+                {**export_kwargs, "external_data": f"{onnx_path}.data"}
+                if external_data
+                else export_kwargs,
+            )
+            for model_path, onnx_path in jobs
+        ]
+        results = []
+        for (model_path, onnx_path), future in zip(jobs, futures):
+            try:
+                results.append(future.result())
+            except Exception:
+                # The worker itself died, e.g. killed by the OS
+                error = traceback.format_exc()
+                results.append(ExportResult(model_path, onnx_path, error=error))
+    return results
+
+
+def _init_export_worker():
+    # Registers the serializable kerox classes, so saved models can be loaded
+    from kerox import layers, models
+
+    # Pay the backend initialization once per worker, not on the first model
+    warmup = models.KeroxSequential([layers.InputLayer(shape=(1,)), layers.Dense(1)])
+    build_onnx_model(warmup)
+
+
+def _export_saved_model(
+    model_path: str, onnx_path: str, export_kwargs: dict
+) -> ExportResult:
+    result = ExportResult(model_path, onnx_path)
+    model = None
+    start = time.perf_counter()
+    try:
+        model = saving.load_model(model_path)
+        result.load_time_s = time.perf_counter() - start
+        start = time.perf_counter()
+        onnx.save(build_onnx_model(model, **export_kwargs), onnx_path)
+        result.export_time_s = time.perf_counter() - start
+    except Exception:
+        # Timed up to the failure, in the step that failed
+        if model is None:
+            result.load_time_s = time.perf_counter() - start
+        else:
+            result.export_time_s = time.perf_counter() - start
+        result.error = traceback.format_exc()
+    return result
@@ -0,0 +1,131 @@
+import os
+from typing import TYPE_CHECKING, Optional
+
+import numpy as np
+import onnx
+
+if TYPE_CHECKING:
+    import spox
+
+# Page aligned offsets let ONNX Runtime and `np.memmap` map tensors directly
+DEFAULT_ALIGNMENT = 4096
+
+
+class ExternalDataWriter:
+    """Stream weights to an ONNX external data file while the model is traced.
+
+    Each weight is written as soon as it is visited and only a placeholder
+    spox argument of the same type is kept in the graph, so the whole weight
+    set is never held in memory nor in the protobuf. `finalize` then turns the
+    placeholders into initializers referencing their offset in the file.
+
+    Args:
+        path: Path of the data file. The exported model must be saved in the
+            same directory, since initializers refer to the file by its name.
+        alignment: Byte alignment of the offset of each tensor in the file.
+    """
+
+    def __init__(self, path: str | os.PathLike, alignment: int = DEFAULT_ALIGNMENT):
+        self.path = os.fspath(path)
+        self.alignment = alignment
+        self.tensors: dict[str, tuple["spox.Var", int, int]] = {}
+        self._file = None
+
+    def __enter__(self) -> "ExternalDataWriter":
+        self._file = open(self.path, "wb")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.close()
+        self._file = None
+
+    def add(self, name: str, value: np.ndarray) -> "spox.Var":
+        """Write `value` to the data file and return its placeholder var."""
+        # Imported here, so that loading external data doesn't require spox
+        import spox
+
+        if self._file is None:
+            raise RuntimeError("ExternalDataWriter must be used as a context manager.")
+        if name in self.tensors:
+            raise ValueError(f"Duplicate weight name in external data: {name}")
+        value = np.ascontiguousarray(value)
+        offset = -(-self._file.tell() // self.alignment) * self.alignment
+        self._file.seek(offset)
+        self._file.write(value.data if value.size else b"")
+        var = spox.argument(spox.Tensor(value.dtype, value.shape))
+        var._rename(name)
+        self.tensors[name] = (var, offset, value.nbytes)
+        return var
+
+    @property
+    def arguments(self) -> dict[str, "spox.Var"]:
+        """Placeholder vars to list as inputs when building the model."""
+        return {name: var for name, (var, _, _) in self.tensors.items()}
+
+    def finalize(self, model_proto: onnx.ModelProto) -> onnx.ModelProto:
+        """Replace the placeholder graph inputs by external data initializers."""
+        graph = model_proto.graph
+        location = os.path.basename(self.path)
+        placeholders = {
+            value_info.name: value_info
+            for value_info in graph.input
+            if value_info.name in self.tensors
+        }
+        inputs = [
+            value_info
+            for value_info in graph.input
+            if value_info.name not in placeholders
+        ]
+        del graph.input[:]
+        graph.input.extend(inputs)
+        for name, value_info in placeholders.items():
+            _, offset, length = self.tensors[name]
+            tensor_type = value_info.type.tensor_type
+            tensor = onnx.TensorProto(
+                name=name,
+                data_type=tensor_type.elem_type,
+                dims=[dim.dim_value for dim in tensor_type.shape.dim],
+                data_location=onnx.TensorProto.EXTERNAL,
+            )
+            for key, value in (
+                ("location", location),
+                ("offset", str(offset)),
+                ("length", str(length)),
+            ):
+                entry = tensor.external_data.add()
+                entry.key, entry.value = key, value
+            graph.initializer.append(tensor)
+        return model_proto
+
+
+def memory_map_initializers(
+    model_proto: onnx.ModelProto, base_dir: Optional[str | os.PathLike] = None
+) -> dict[str, np.ndarray]:
+    """Memory-map the external data initializers of `model_proto`.
+
+    Args:
+        model_proto: Model whose initializers refer to external data files.
+        base_dir: Directory the `location` of the initializers is relative to,
+            usually that of the saved model. Defaults to the working directory.
+
+    Returns:
+        Read-only arrays backed by the data files, keyed by initializer name.
+    """
+    arrays = {}
+    for tensor in model_proto.graph.initializer:
+        if tensor.data_location != onnx.TensorProto.EXTERNAL:
+            continue
+        info = {entry.key: entry.value for entry in tensor.external_data}
+        path = os.path.join(os.fspath(base_dir or "."), info["location"])
+        dtype = onnx.helper.tensor_dtype_to_np_dtype(tensor.data_type)
+        shape = tuple(tensor.dims)
+        if int(np.prod(shape)) == 0:
+            arrays[tensor.name] = np.empty(shape, dtype)
+            continue
+        arrays[tensor.name] = np.memmap(
+            path, dtype=dtype, mode="r", offset=int(info.get("offset", 0)), shape=shape
+        )
+    return arrays
+
+
+__all__ = ["ExternalDataWriter", "memory_map_initializers"]
@@ -2,3 +2,7 @@ from kerox.layers.dense import Dense  # noqa: F401
 from kerox.layers.dropout import Dropout  # noqa: F401
 from kerox.layers.input_layer import InputLayer, KeroxInput  # noqa: F401
 from kerox.layers.layer import Layer  # noqa: F401
+from kerox.layers.normalization import (  # noqa: F401
+    BatchNormalization,
+    LayerNormalization,
+)
@@ -1,7 +1,12 @@
+from typing import Optional
+
+import numpy as np
 from keras import InputSpec, constraints, initializers, regularizers, saving
 
-from kerox import activations, ops
+from kerox import activations, ops, quantization
+from kerox.core import KeroxTensor, get_onnx_build_scope, weight_var
 from kerox.layers import layer
+from kerox.ops.utils import sops, to_spox_var
 
 
 @saving.register_keras_serializable(package="kerox")
@@ -120,17 +125,88 @@ class Dense(layer.Layer):
         if not self.built:
             raise AttributeError("You must build the layer before accessing `kernel`.")
         if self.lora_enabled:
-            return self._kernel + ops.matmul(self.lora_kernel_a, self.lora_kernel_b)
+            scope = get_onnx_build_scope()
+            if scope is None:
+                return self._kernel + ops.matmul(self.lora_kernel_a, self.lora_kernel_b)
+            if scope.merge_lora:
+                return self._merged_lora_kernel_spox(scope)
+            lora_delta = ops.matmul(self.lora_kernel_a, self.lora_kernel_b)
+            return ops.add(self._kernel, lora_delta)
         return self._kernel
 
+    def _get_kernel_with_merged_lora(self):
+        if not self.lora_enabled:
+            return self._kernel
+        lora_delta = ops.kops.matmul(self.lora_kernel_a, self.lora_kernel_b)
+        return ops.kops.add(self._kernel, lora_delta)
+
+    def _merged_lora_kernel_spox(self, scope) -> KeroxTensor:
+        # Exported under the original kernel name, as `save_own_variables` does
+        key = (id(self._kernel), "merged_lora")
+        if key not in scope.spox_vars:
+            kernel_value = self._get_kernel_with_merged_lora()
+            scope.spox_vars[key] = weight_var(
+                self._kernel.path, ops.kops.convert_to_numpy(kernel_value)
+            )
+        return KeroxTensor(spox_var=scope.spox_vars[key])
+
     def call(self, inputs, training=None):
-        x = ops.matmul(inputs, self.kernel)
-        if self.bias is not None:
-            x = ops.add(x, self.bias)
+        quantization.record_input_range(self, inputs)
+        scope = get_onnx_build_scope()
+        if scope is not None and quantization.is_quantized(self, scope.quantization):
+            inputs, kernel, bias = quantization.quantize_dense_operands(
+                self, inputs, scope.quantization
+            )
+        elif scope is not None and scope.mixed_precision == "float16":
+            inputs, kernel, bias = self._float16_operands(scope, inputs)
+        else:
+            kernel, bias = self.kernel, self.bias
+            if scope is not None and scope.mixed_precision == "bfloat16":
+                scope.bfloat16_weights.update(weight.path for weight in self.weights)
+        if self._can_use_gemm(inputs):
+            args = [to_spox_var(inputs), to_spox_var(kernel)]
+            if bias is not None:
+                args.append(to_spox_var(bias))
+            x = KeroxTensor(spox_var=sops.gemm(*args))
+        else:
+            x = ops.matmul(inputs, kernel)
+            if bias is not None:
+                x = ops.add(x, bias)
         if self.activation is not None:
             x = self.activation(x)
         return x
 
+    def _float16_operands(
+        self, scope, inputs
+    ) -> tuple[KeroxTensor, KeroxTensor, Optional[KeroxTensor]]:
+        if self.lora_enabled and not scope.merge_lora:
+            raise ValueError(
+                "float16 mixed precision requires LoRA adapters to be merged, "
+                "export with `merge_lora=True`."
+            )
+        if to_spox_var(inputs).unwrap_tensor().dtype != np.float16:
+            inputs = ops.cast(inputs, "float16")
+        kernel = self._float16_weight(
+            scope, self._kernel, self._get_kernel_with_merged_lora()
+        )
+        bias = None
+        if self.bias is not None:
+            bias = self._float16_weight(scope, self.bias, self.bias)
+        return inputs, kernel, bias
+
+    def _float16_weight(self, scope, variable, value) -> KeroxTensor:
+        key = (id(variable), "float16")
+        if key not in scope.spox_vars:
+            value = ops.kops.convert_to_numpy(value).astype(np.float16)
+            scope.spox_vars[key] = weight_var(variable.path, value)
+        return KeroxTensor(spox_var=scope.spox_vars[key])
+
+    def _can_use_gemm(self, inputs) -> bool:
+        scope = get_onnx_build_scope()
+        if scope is None or not scope.use_gemm or len(inputs.shape) != 2:
+            return False
+        return np.issubdtype(to_spox_var(inputs).unwrap_tensor().dtype, np.floating)
+
     def enable_lora(self, rank, a_initializer="he_uniform", b_initializer="zeros"):
         if self.kernel_constraint:
             raise ValueError(
@@ -174,11 +250,15 @@ class Dense(layer.Layer):
             store[str(i)] = variable
 
     def load_own_variables(self, store):
-        if not self.lora_enabled:
-            self._check_load_own_variables(store)
         # Do nothing if the layer isn't yet built
         if not self.built:
             return
+        expected = 2 if self.use_bias else 1
+        if len(store.keys()) != expected:
+            raise ValueError(
+                f"Layer '{self.name}' expected {expected} variables, but the "
+                f"weights file lists {len(store.keys())} variables for it."
+            )
         # The keys of the `store` will be saved as determined because the
         # default ordering will change after quantization
         target_variables = [self._kernel]
@@ -187,8 +267,8 @@ class Dense(layer.Layer):
         for i, variable in enumerate(target_variables):
             variable.assign(store[str(i)])
         if self.lora_enabled:
-            self.lora_kernel_a.assign(ops.zeros(self.lora_kernel_a.shape))
-            self.lora_kernel_b.assign(ops.zeros(self.lora_kernel_b.shape))
+            self.lora_kernel_a.assign(ops.kops.zeros(self.lora_kernel_a.shape))
+            self.lora_kernel_b.assign(ops.kops.zeros(self.lora_kernel_b.shape))
 
     def get_config(self):
         base_config = super().get_config()
@@ -1,14 +1,28 @@
 from keras import layers as klayers
+from keras import saving
 
+from kerox.core import get_onnx_build_scope
 from kerox.layers import layer
 from kerox.ops.random import dropout
 
 
+@saving.register_keras_serializable(package="kerox")
 class Dropout(klayers.Dropout, layer.Layer):
-    def __init__(self, rate, seed=None, **kwargs):
+    """`keras.layers.Dropout`, exportable to ONNX.
+
+    The exported dropout mask has the shape of the inputs, so `noise_shape` is
+    only accepted as `None`, as Keras saves it in the layer config.
+    """
+
+    def __init__(self, rate, noise_shape=None, seed=None, **kwargs):
+        if noise_shape is not None:
+            raise ValueError("Dropout with a `noise_shape` can't be exported to ONNX.")
         super().__init__(rate, noise_shape=None, seed=seed, **kwargs)
 
     def call(self, inputs, training=False):
+        scope = get_onnx_build_scope()
+        if scope is not None and scope.dropout_training is not None:
+            training = True
         if training and self.rate > 0:
             return dropout(inputs, self.rate, seed=self.seed_generator)
         return inputs
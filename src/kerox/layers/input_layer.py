@@ -1,23 +1,39 @@
-from functools import wraps
+from functools import partial, wraps
+from typing import Optional
 
 from keras import layers as klayers
 
-from kerox.core import KeroxTensor
+from kerox.core import KeroxTensor, override_backend
 from kerox.layers.layer import Layer
 
 
 class InputLayer(klayers.InputLayer, Layer):
     @wraps(klayers.InputLayer.__init__)
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, dynamic_axes: Optional[dict[int, str]] = None, **kwargs):
         import keras.src.layers.core.input_layer as _parent_module
 
-        # Patch the backend KerasTensor to be KeroxTensor for the duration of the call
-        KerasTensor = _parent_module.backend.KerasTensor
-        _parent_module.backend.KerasTensor = KeroxTensor
-        try:
+        # JSON configs turn the axes into strings
+        dynamic_axes = {int(axis): name for axis, name in (dynamic_axes or {}).items()}
+        if dynamic_axes and kwargs.get("input_tensor") is not None:
+            raise ValueError(
+                "`dynamic_axes` cannot be used with `input_tensor`, create the "
+                "tensor with `KeroxTensor(..., dynamic_axes=...)` instead."
+            )
+        # The backend KerasTensor is KeroxTensor for the duration of the call
+        tensor_class = (
+            partial(KeroxTensor, dynamic_axes=dynamic_axes)
+            if dynamic_axes
+            else KeroxTensor
+        )
+        with override_backend(_parent_module, KerasTensor=tensor_class):
             super().__init__(*args, **kwargs)
-        finally:
-            _parent_module.backend.KerasTensor = KerasTensor
+        self.dynamic_axes = dynamic_axes
+
+    def get_config(self):
+        config = super().get_config()
+        if self.dynamic_axes:
+            config["dynamic_axes"] = dict(self.dynamic_axes)
+        return config
 
 
 @wraps(klayers.Input)
@@ -57,6 +73,9 @@ def KeroxInput(*args, **kwargs) -> KeroxTensor:
             than creating a new placeholder tensor.
         optional: Boolean, whether the input is optional or not.
             An optional input can accept `None` values.
+        dynamic_axes: Optional dict mapping axes of the batch shape to the
+            name of their symbolic dimension in the exported ONNX model, e.g.
+            `{0: "batch", 1: "sequence"}`. Named axes are unknown in Keras too.
 
     Returns:
       A Kerox tensor.
@@ -1,11 +1,18 @@
 from abc import ABC
 from functools import wraps
 
-from keras import Operation
+from keras import Operation, tree
 from keras import layers as klayers
 from optree import PyTree
 
-from kerox.core import KeroxTensor, KeroxVariable, ONNXBuildScope, in_onnx_build_scope
+from kerox.core import (
+    KeroxTensor,
+    KeroxVariable,
+    ONNXBuildScope,
+    get_onnx_build_scope,
+    in_onnx_build_scope,
+    override_backend,
+)
 
 
 class Layer(klayers.Layer, ABC):
@@ -43,20 +50,36 @@ class Layer(klayers.Layer, ABC):
         """
         import keras.src.layers.layer as _parent_module
 
-        # Patch the backend Variable to be KeroxVariable for the duration of the call
-        Variable = _parent_module.backend.Variable
-        _parent_module.backend.Variable = KeroxVariable
-        try:
-            result = super().add_weight(*args, **kwargs)
-        finally:
-            _parent_module.backend.Variable = Variable
-        return result
+        # The backend Variable is KeroxVariable for the duration of the call
+        with override_backend(_parent_module, Variable=KeroxVariable):
+            return super().add_weight(*args, **kwargs)
+
+    @property
+    def _convert_input_args(self) -> bool:
+        # Keras autocasts inputs with Keras ops, which would leave the ONNX graph,
+        # and float16 values of mixed precision exports must reach `call` as is
+        return self._kerox_convert_input_args and not in_onnx_build_scope()
+
+    @_convert_input_args.setter
+    def _convert_input_args(self, value: bool):
+        self._kerox_convert_input_args = value
 
     def symbolic_call(self, *args, **kwargs):
         # Whenever building the ONNX model, we want to call the layer's `call` method
         if in_onnx_build_scope():
-            if all(isinstance(arg, KeroxTensor) for arg in args):
-                return self.call(*args, **kwargs)
+            if all(isinstance(arg, KeroxTensor) for arg in tree.flatten(args)):
+                outputs = self.call(*args, **kwargs)
+                # Layers without weights are never built under a name scope
+                get_onnx_build_scope().tag_layer_nodes(
+                    self.path or self.name,
+                    [arg.spox_var() for arg in tree.flatten(args)],
+                    [
+                        output.spox_var()
+                        for output in tree.flatten(outputs)
+                        if isinstance(output, KeroxTensor)
+                    ],
+                )
+                return outputs
             else:
                 raise ValueError(
                     f"Expected all arguments to be KeroxTensor when in ONNX build scope, but got {args}"
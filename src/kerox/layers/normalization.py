@@ -0,0 +1,150 @@
+import numpy as np
+from keras import layers as klayers
+from keras import saving
+
+from kerox.core import KeroxTensor, get_onnx_build_scope, weight_var
+from kerox.layers import layer
+from kerox.ops.utils import (
+    float32_if_mixed_precision,
+    sops,
+    spox_constant_like,
+    to_spox_var,
+)
+
+
+@saving.register_keras_serializable(package="kerox")
+class BatchNormalization(klayers.BatchNormalization, layer.Layer):
+    """`keras.layers.BatchNormalization`, exportable to ONNX.
+
+    In inference mode, the normalization by the moving statistics is an affine
+    map, exported as a `Mul` by the constant `{path}/scale` and an `Add` of the
+    constant `{path}/shift`, both computed at export time. The opt-in
+    `kerox.optimize.fold_scale_shift` pass folds them into the kernel and bias
+    of a preceding `Dense`. In training mode, the batch statistics are
+    computed in the graph and the moving statistics are left as is, so
+    `kerox.training.fit_onnxruntime` refuses trainable batch normalization.
+    """
+
+    def call(self, inputs, training=None, mask=None):
+        scope = get_onnx_build_scope()
+        if scope is None:
+            return super().call(inputs, training=training, mask=mask)
+        if mask is not None:
+            raise ValueError("Masked batch normalization can't be exported to ONNX.")
+        x = to_spox_var(inputs)
+        if not (training and self.trainable):
+            dtype = x.unwrap_tensor().dtype
+            scale, shift = (
+                self._exported_constant(scope, name, value.astype(dtype))
+                for name, value in zip(("scale", "shift"), self.scale_and_shift())
+            )
+            return KeroxTensor(spox_var=sops.add(sops.mul(x, scale), shift))
+        rank = len(inputs.shape)
+        axis = self.axis % rank
+        x = float32_if_mixed_precision(x)
+        x = normalize(x, [i for i in range(rank) if i != axis], self.epsilon)
+        if self.scale:
+            x = sops.mul(x, self._broadcast(self.gamma.spox_var(), rank))
+        if self.center:
+            x = sops.add(x, self._broadcast(self.beta.spox_var(), rank))
+        return KeroxTensor(spox_var=x)
+
+    def scale_and_shift(self) -> tuple[np.ndarray, np.ndarray]:
+        """Scale and shift the layer applies in inference mode, as exported."""
+        variance = self.moving_variance.numpy().astype(np.float64)
+        scale = 1 / np.sqrt(variance + self.epsilon)
+        if self.scale:
+            scale = scale * self.gamma.numpy()
+        shift = -self.moving_mean.numpy() * scale
+        if self.center:
+            shift = shift + self.beta.numpy()
+        shape = self._broadcast_shape(self.input_spec.ndim)
+        return (
+            scale.reshape(shape).astype(np.float32),
+            shift.reshape(shape).astype(np.float32),
+        )
+
+    def _exported_constant(self, scope, name: str, value: np.ndarray):
+        key = (id(self), name)
+        if key not in scope.spox_vars:
+            scope.spox_vars[key] = weight_var(
+                f"{self.path}/{name}", value, trainable=False
+            )
+        return scope.spox_vars[key]
+
+    def _broadcast_shape(self, rank: int) -> tuple[int, ...]:
+        # Vectors broadcast along the last axis as they are
+        axis = self.axis % rank
+        if axis == rank - 1:
+            return (-1,)
+        return tuple(-1 if i == axis else 1 for i in range(rank))
+
+    def _broadcast(self, var, rank: int):
+        shape = self._broadcast_shape(rank)
+        if len(shape) == 1:
+            return var
+        return sops.reshape(var, sops.constant(value=np.array(shape, dtype=np.int64)))
+
+
+@saving.register_keras_serializable(package="kerox")
+class LayerNormalization(klayers.LayerNormalization, layer.Layer):
+    """`keras.layers.LayerNormalization`, exportable to ONNX.
+
+    Normalization over trailing axes is exported as a single ONNX
+    `LayerNormalization` node, other axes and `rms_scaling` as the elementwise
+    ops computing it. Like Keras, it computes in float32 when the inputs are
+    float16.
+    """
+
+    def call(self, inputs):
+        if get_onnx_build_scope() is None:
+            return super().call(inputs)
+        x = float32_if_mixed_precision(to_spox_var(inputs))
+        rank = len(inputs.shape)
+        axes = [axis % rank for axis in self.axis]
+        gamma = None if self.gamma is None else self.gamma.spox_var()
+        beta = None if self.beta is None else self.beta.spox_var()
+        if not self.rms_scaling and axes == list(range(axes[0], rank)):
+            if gamma is None:
+                normalized_shape = tuple(inputs.shape[axes[0] :])
+                gamma = sops.constant(
+                    value=np.ones(normalized_shape, dtype=x.unwrap_tensor().dtype)
+                )
+            x = sops.layer_normalization(
+                x, gamma, beta, axis=axes[0], epsilon=self.epsilon
+            )[0]
+            return KeroxTensor(spox_var=x)
+        # Parameters have the shape of the normalized axes
+        shape = np.array(
+            [inputs.shape[i] if i in axes else 1 for i in range(rank)], dtype=np.int64
+        )
+        if self.rms_scaling:
+            # Keras scales by the standard deviation without centering
+            _, variance = moments(x, axes)
+            inv = sops.reciprocal(
+                sops.sqrt(sops.add(variance, spox_constant_like(x, self.epsilon)))
+            )
+            x = sops.mul(x, inv)
+        else:
+            x = normalize(x, axes, self.epsilon)
+        if gamma is not None:
+            x = sops.mul(x, sops.reshape(gamma, sops.constant(value=shape)))
+        if beta is not None:
+            x = sops.add(x, sops.reshape(beta, sops.constant(value=shape)))
+        return KeroxTensor(spox_var=x)
+
+
+def moments(x, axes: list[int]):
+    """Mean and variance of spox var `x` over `axes`, keeping them."""
+    axes = sops.constant(value=np.array(axes, dtype=np.int64))
+    mean = sops.reduce_mean(x, axes, keepdims=1)
+    centered = sops.sub(x, mean)
+    variance = sops.reduce_mean(sops.mul(centered, centered), axes, keepdims=1)
+    return mean, variance
+
+
+def normalize(x, axes: list[int], epsilon: float):
+    """Standardize spox var `x` over `axes` by its own statistics."""
+    mean, variance = moments(x, axes)
+    std = sops.sqrt(sops.add(variance, spox_constant_like(x, epsilon)))
+    return sops.div(sops.sub(x, mean), std)
@@ -1,5 +1,9 @@
+import os
+import types
 import typing
 
+import onnx
+import onnxruntime as ort
 from keras import saving
 from keras.src.models import Functional as KerasFunctional
 from keras.src.models import Sequential as KerasSequential
@@ -9,8 +13,11 @@ from keras.src.models.model import (
     functional_init_arguments,
 )
 
-from kerox import ops
+from kerox import export, ops, runtime, training
+from kerox.cache import ExportCache
+from kerox.core import KeroxTensor
 from kerox.layers import layer
+from kerox.optimize import GraphPass
 
 
 # layer.Layer inheritance applies kerox Layer __call__ method modifications
@@ -33,6 +40,153 @@ class KeroxModel(KerasModel, layer.Layer):
         else:
             layer.Layer.__init__(self, *args, **kwargs)
 
+    def export_onnx(
+        self,
+        inputs: typing.Optional[KeroxTensor | typing.Sequence[KeroxTensor]] = None,
+        *,
+        training: bool = False,
+        merge_lora: typing.Optional[bool] = None,
+        use_gemm: bool = True,
+        optimize: bool | typing.Sequence[GraphPass] = True,
+        dynamic_axes: typing.Optional[dict[str, dict[int, str]]] = None,
+        batch_dim: typing.Optional[str] = "batch",
+        external_data: typing.Optional[str | os.PathLike] = None,
+        mixed_precision: typing.Optional[str] = None,
+        mc_dropout_samples: typing.Optional[int] = None,
+        preprocessing: typing.Optional[typing.Callable] = None,
+        raw_inputs: typing.Optional[KeroxTensor | typing.Sequence[KeroxTensor]] = None,
+        cache: typing.Optional[ExportCache] = None,
+        **session_kwargs,
+    ) -> tuple[onnx.ModelProto, ort.InferenceSession]:
+        """Export the model to ONNX and compile it into an ONNX Runtime session.
+
+        The session is kept on the model and used by `predict_onnx`.
+
+        Args:
+            inputs: Symbolic inputs to trace the model with. Defaults to
+                `self.inputs`, only available for functional and sequential
+                models.
+            training: Whether to export the model in training mode.
+            merge_lora: Whether to merge LoRA adapters into their kernels.
+                Defaults to `not training`.
+            use_gemm: Whether to lower `Dense` layers on 2-D inputs to `Gemm`.
+            optimize: Whether to run the default graph passes of
+                `kerox.optimize` over the exported graph, or the passes to run.
+            dynamic_axes: Names of symbolic input dimensions keyed by graph
+                input name and axis.
+            batch_dim: Name of the leading dimension of inputs with an unknown
+                batch size, or `None` to leave it anonymous.
+            external_data: Optional path of a file to stream the weights to.
+                The session memory-maps them from it.
+            mixed_precision: Optional half precision dtype, `"float16"` or
+                `"bfloat16"`, to store the `Dense` weights in.
+            mc_dropout_samples: Optional number of Monte-Carlo dropout samples
+                the session averages its outputs over, returning their mean
+                and variance.
+            preprocessing: Optional ndonnx function fused in front of the model,
+                mapping the `raw_inputs` to the model inputs.
+            raw_inputs: Symbolic inputs of `preprocessing`, the session inputs.
+            cache: Optional `kerox.cache.ExportCache` to read the exported
+                model from, if the model didn't change since it was cached.
+            **session_kwargs: Forwarded to `kerox.runtime.make_inference_session`
+                (`graph_optimization_level`, `intra_op_num_threads`,
+                `inter_op_num_threads`, `execution_mode`, `providers`).
+
+        Returns:
+            A tuple with the ONNX model and its inference session.
+        """
+        build_onnx_model = (
+            export.build_onnx_model if cache is None else cache.build_onnx_model
+        )
+        model_proto = build_onnx_model(
+            self,
+            inputs,
+            training=training,
+            merge_lora=merge_lora,
+            use_gemm=use_gemm,
+            optimize=optimize,
+            dynamic_axes=dynamic_axes,
+            batch_dim=batch_dim,
+            external_data=external_data,
+            mixed_precision=mixed_precision,
+            mc_dropout_samples=mc_dropout_samples,
+            preprocessing=preprocessing,
+            raw_inputs=raw_inputs,
+        )
+        if external_data is not None:
+            session_kwargs.setdefault(
+                "external_data_dir", os.path.dirname(os.path.abspath(external_data))
+            )
+        session = runtime.make_inference_session(model_proto, **session_kwargs)
+        self._onnx_session = session
+        return model_proto, session
+
+    def fit(self, x=None, y=None, *args, use_onnxruntime: bool = False, **kwargs):
+        """Train the model, with Keras or with ONNX Runtime training.
+
+        Without `use_onnxruntime`, this is `keras.Model.fit`. Otherwise the
+        epochs run in ONNX Runtime, see `kerox.training.fit_onnxruntime` for
+        the supported arguments, losses and optimizers.
+
+        Args:
+            x: Input data.
+            y: Target data.
+            use_onnxruntime: Whether to train with ONNX Runtime training. The
+                trained weights are assigned back to the model at the end.
+            **kwargs: Forwarded to `keras.Model.fit` or
+                `kerox.training.fit_onnxruntime`.
+
+        Returns:
+            A `keras.callbacks.History` object.
+        """
+        if use_onnxruntime and args:
+            raise ValueError(
+                "Pass the arguments of `fit` by keyword with `use_onnxruntime=True`."
+            )
+        try:
+            if not use_onnxruntime:
+                return super().fit(x, y, *args, **kwargs)
+            return training.fit_onnxruntime(self, x, y, **kwargs)
+        finally:
+            # The weights changed, even if training stopped early
+            self.reset_onnx_session()
+
+    def set_weights(self, weights):
+        super().set_weights(weights)
+        self.reset_onnx_session()
+
+    def load_weights(self, filepath, skip_mismatch=False, **kwargs):
+        super().load_weights(filepath, skip_mismatch=skip_mismatch, **kwargs)
+        self.reset_onnx_session()
+
+    def reset_onnx_session(self):
+        """Drop the session kept by `export_onnx`, so `predict_onnx` re-exports.
+
+        `fit`, `set_weights` and `load_weights` call it, but weights changed in
+        other ways, e.g. with `assign`, need an explicit call.
+        """
+        self._onnx_session = None
+
+    def predict_onnx(self, x, batch_size: typing.Optional[int] = 32):
+        """Generate output predictions through the exported ONNX Runtime session.
+
+        The session of the last `export_onnx` call is reused. If there is none,
+        or `reset_onnx_session` dropped it since the weights changed, the model
+        is exported with default settings first.
+
+        Args:
+            x: A NumPy array-like, or a list of them if the model has several
+                inputs.
+            batch_size: Number of samples per session call. If `None`, all
+                samples are run in a single call.
+
+        Returns:
+            A NumPy array, or a list of them if the model has several outputs.
+        """
+        if getattr(self, "_onnx_session", None) is None:
+            self.export_onnx()
+        return runtime.predict(self._onnx_session, x, batch_size=batch_size)
+
 
 @saving.register_keras_serializable(package="kerox")
 class KeroxFunctional(KerasFunctional, KeroxModel):
@@ -53,8 +207,8 @@ class KeroxSequential(KerasSequential, KeroxModel):
     def build(self, input_shape=None):
         super().build(input_shape)
         if self._functional:  # Cast to KeroxFunctional by replacing methods
-            self._functional._convert_inputs_to_tensors = (
-                KeroxFunctional._convert_inputs_to_tensors
+            self._functional._convert_inputs_to_tensors = types.MethodType(
+                KeroxFunctional._convert_inputs_to_tensors, self._functional
             )
             self._functional = typing.cast(KeroxFunctional, self._functional)
 
@@ -1,3 +1,24 @@
-from kerox.ops.core import *  # noqa: F401, F403
-from kerox.ops.numpy import *  # noqa: F401, F403
-from kerox.ops.utils import *  # noqa: F401, F403
+# Ops are looked up on first access (PEP 562), in the order star imports of
+# `kerox.ops.core`, `kerox.ops.numpy` and `kerox.ops.utils` would resolve them.
+import importlib
+
+_MODULES = ("kerox.ops.utils", "kerox.ops.numpy", "kerox.ops.core")
+
+
+def __getattr__(name: str):
+    if not name.startswith("_"):
+        for module_name in _MODULES:
+            module = importlib.import_module(module_name)
+            if hasattr(module, name):
+                value = getattr(module, name)
+                globals()[name] = value
+                return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    names = set(globals())
+    for module_name in _MODULES:
+        module = importlib.import_module(module_name)
+        names |= {name for name in vars(module) if not name.startswith("_")}
+    return sorted(names)
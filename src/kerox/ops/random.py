@@ -1,22 +1,42 @@
 import numpy as np
+import spox
 from keras.src.backend import random as krandom
 from keras.src.random.seed_generator import draw_seed
 
-from kerox.core import KeroxTensor, in_onnx_build_scope
+from kerox.core import KeroxTensor, get_onnx_build_scope, in_onnx_build_scope
 from kerox.ops.utils import kops, sops, spox_constant_like, to_spox_var
 from kerox.typing import ArrayOrTensor
 
 
 def as_int_seed(seed):
     a, b = kops.convert_to_numpy(draw_seed(seed))
-    return int(a + b * 2**32)
+    # Python ints, as uint32 arithmetic would overflow, within the int64 attribute
+    return (int(b) << 32 | int(a)) % 2**63
 
 
 def dropout(inputs: ArrayOrTensor, rate: float, seed=None) -> ArrayOrTensor:
     if in_onnx_build_scope():
         seed = as_int_seed(seed)
         inputs = to_spox_var(inputs)
+        train = get_onnx_build_scope().dropout_training
+        if train is not None:
+            return KeroxTensor(spox_var=toggled_dropout(inputs, rate, train, seed))
         rate = spox_constant_like(inputs, rate)
         train = sops.constant(value=np.array(True))
         return KeroxTensor(spox_var=sops.dropout(inputs, rate, train, seed=seed)[0])
     return krandom.dropout(inputs, rate=rate, seed=seed)
+
+
+def toggled_dropout(
+    inputs: spox.Var, rate: float, train: spox.Var, seed: int
+) -> spox.Var:
+    """Dropout applied only when the boolean var `train` is true at run time.
+
+    Built from a random mask rather than a `Dropout` node, which ONNX Runtime
+    removes from inference sessions whatever its `training_mode` input.
+    """
+    noise = sops.random_uniform_like(inputs, seed=float(seed))
+    keep = sops.greater_or_equal(noise, spox_constant_like(noise, rate))
+    scaled = sops.mul(inputs, spox_constant_like(inputs, 1 / (1 - rate)))
+    dropped = sops.where(keep, scaled, spox_constant_like(inputs, 0))
+    return sops.where(train, dropped, inputs)
@@ -1,7 +1,7 @@
+import sys
 from functools import wraps
 from typing import Callable, Sequence
 
-import ndonnx
 import numpy as np
 import spox
 from keras import ops as kops  # noqa: F401
@@ -10,14 +10,21 @@ from spox.opset.ai.onnx import v21 as sops  # noqa: F401
 from kerox import core
 from kerox.typing import ArrayOrTensor
 
+# Version of the default ONNX domain targeted by `sops`
+ONNX_OPSET = 21
+
 
 def to_spox_var(x: ArrayOrTensor) -> spox.Var:
-    if isinstance(x, (core.KeroxVariable, core.KeroxTensor, ndonnx.Array)):
+    if isinstance(x, (core.KeroxVariable, core.KeroxTensor)):
+        return x.spox_var()
+    # ndonnx is slow to import, arrays can only come from it if it's already loaded
+    ndonnx = sys.modules.get("ndonnx")
+    if ndonnx is not None and isinstance(x, ndonnx.Array):
         return x.spox_var()
     if isinstance(x, spox.Var):
         return x
-    x = np.array(x)
-    return spox.argument(spox.Tensor(x.dtype, x.shape))
+    # Concrete values are constants of the graph, not inputs with a fixed shape
+    return sops.constant(value=np.array(x))
 
 
 def many_to_spox_var(*xs: ArrayOrTensor) -> Sequence[spox.Var]:
@@ -41,3 +48,17 @@ def spox_auto_adapt_op(keras_func: Callable, spox_func: Callable) -> Callable:
 def spox_constant_like(spox_var: spox.Var, value):
     tensor = spox_var.unwrap_tensor()
     return sops.const(value, dtype=tensor.dtype)
+
+
+def float32_if_mixed_precision(x: spox.Var) -> spox.Var:
+    """Cast float16 `x` to float32 when exporting in mixed precision.
+
+    Used by activations whose exponentials and logarithms overflow or lose too
+    much precision in float16.
+    """
+    scope = core.get_onnx_build_scope()
+    if scope is None or scope.mixed_precision is None:
+        return x
+    if x.unwrap_tensor().dtype != np.float16:
+        return x
+    return sops.cast(x, to=np.float32)
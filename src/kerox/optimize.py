@@ -0,0 +1,537 @@
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+import onnx
+from onnx import TensorProto, numpy_helper
+from onnx.reference import ReferenceEvaluator
+
+GraphPass = Callable[[onnx.ModelProto], onnx.ModelProto]
+
+# Ops whose result may differ between two evaluations with the same inputs
+NONDETERMINISTIC_OPS = {
+    "Bernoulli",
+    "Dropout",
+    "Multinomial",
+    "RandomNormal",
+    "RandomNormalLike",
+    "RandomUniform",
+    "RandomUniformLike",
+}
+# Ops that turn small constants into large ones, not worth folding
+EXPANDING_OPS = {"ConstantOfShape", "Expand", "Range", "Tile"}
+
+_INTS = {
+    TensorProto.INT8,
+    TensorProto.INT16,
+    TensorProto.INT32,
+    TensorProto.INT64,
+    TensorProto.UINT8,
+    TensorProto.UINT16,
+    TensorProto.UINT32,
+    TensorProto.UINT64,
+}
+_FLOATS = {
+    TensorProto.FLOAT16,
+    TensorProto.BFLOAT16,
+    TensorProto.FLOAT,
+    TensorProto.DOUBLE,
+}
+# Element types each element type can be cast to and back without loss
+LOSSLESS_CASTS = {
+    TensorProto.BOOL: _INTS | _FLOATS,
+    TensorProto.INT8: {
+        TensorProto.INT16,
+        TensorProto.INT32,
+        TensorProto.INT64,
+        TensorProto.FLOAT16,
+        TensorProto.FLOAT,
+        TensorProto.DOUBLE,
+    },
+    TensorProto.UINT8: (_INTS - {TensorProto.INT8})
+    | {TensorProto.FLOAT16, TensorProto.FLOAT, TensorProto.DOUBLE},
+    TensorProto.INT16: {
+        TensorProto.INT32,
+        TensorProto.INT64,
+        TensorProto.FLOAT,
+        TensorProto.DOUBLE,
+    },
+    TensorProto.INT32: {TensorProto.INT64, TensorProto.DOUBLE},
+    TensorProto.FLOAT16: {TensorProto.FLOAT, TensorProto.DOUBLE},
+    TensorProto.BFLOAT16: {TensorProto.FLOAT, TensorProto.DOUBLE},
+    TensorProto.FLOAT: {TensorProto.DOUBLE},
+}
+
+
+def optimize(
+    model_proto: onnx.ModelProto, passes: Optional[Sequence[GraphPass]] = None
+) -> onnx.ModelProto:
+    """Run a pipeline of graph passes over an exported model.
+
+    Args:
+        model_proto: The model to optimize. It is modified in place.
+        passes: Graph passes to run in order, each taking and returning a
+            `onnx.ModelProto`. Defaults to `DEFAULT_PASSES`.
+
+    Returns:
+        The optimized model, with unused nodes and initializers removed.
+    """
+    for graph_pass in DEFAULT_PASSES if passes is None else passes:
+        model_proto = graph_pass(model_proto)
+    return eliminate_dead_code(model_proto)
+
+
+def fold_constants(model_proto: onnx.ModelProto) -> onnx.ModelProto:
+    """Evaluate nodes whose inputs are all `Constant` outputs at export time.
+
+    Initializers are not folded since they hold the model weights, which may
+    be trained or refreshed after export.
+    """
+    graph = model_proto.graph
+    opsets = {opset.domain: opset.version for opset in model_proto.opset_import}
+    constants = {
+        node.output[0]: constant_value(node)
+        for node in graph.node
+        if is_constant_node(node)
+    }
+    new_nodes = []
+    for node in graph.node:
+        inputs = [name for name in node.input if name]
+        if (
+            inputs
+            and node.domain in ("", "ai.onnx")
+            and node.op_type not in NONDETERMINISTIC_OPS | EXPANDING_OPS
+            and not has_subgraphs(node)
+            and all(name in constants for name in inputs)
+        ):
+            evaluator = ReferenceEvaluator(node, opsets={"": opsets.get("", 21)})
+            feeds = {name: constants[name] for name in inputs}
+            for name, value in zip(node.output, evaluator.run(None, feeds)):
+                value = np.asarray(value)
+                constants[name] = value
+                new_nodes.append(make_constant_node(name, value))
+        else:
+            new_nodes.append(node)
+    replace_nodes(graph, new_nodes)
+    return model_proto
+
+
+def deduplicate_constants(model_proto: onnx.ModelProto) -> onnx.ModelProto:
+    """Merge `Constant` nodes holding the same value into a single one.
+
+    Lowerings create constants per call (e.g. through `spox_constant_like`),
+    so the same scalar is often repeated across the graph.
+    """
+    graph = model_proto.graph
+    seen: dict[tuple, str] = {}
+    renames: dict[str, str] = {}
+    outputs = graph_output_names(graph)
+    new_nodes = []
+    for node in graph.node:
+        if is_constant_node(node) and node.output[0] not in outputs:
+            value = constant_value(node)
+            key = (value.dtype.str, value.shape, value.tobytes())
+            if key in seen:
+                renames[node.output[0]] = seen[key]
+                continue
+            seen[key] = node.output[0]
+        new_nodes.append(node)
+    replace_nodes(graph, new_nodes)
+    rename_inputs(graph, renames)
+    return model_proto
+
+
+def eliminate_common_subexpressions(model_proto: onnx.ModelProto) -> onnx.ModelProto:
+    """Merge deterministic nodes computing the same op over the same inputs."""
+    graph = model_proto.graph
+    outputs = graph_output_names(graph)
+    seen: dict[tuple, onnx.NodeProto] = {}
+    renames: dict[str, str] = {}
+    new_nodes = []
+    for node in graph.node:
+        inputs = tuple(resolve(renames, name) for name in node.input)
+        del node.input[:]
+        node.input.extend(inputs)
+        if (
+            node.op_type in NONDETERMINISTIC_OPS
+            or has_subgraphs(node)
+            or set(node.output) & outputs
+        ):
+            new_nodes.append(node)
+            continue
+        key = (
+            node.domain,
+            node.op_type,
+            inputs,
+            tuple(attr.SerializeToString() for attr in node.attribute),
+        )
+        if key in seen:
+            renames.update(zip(node.output, seen[key].output))
+            continue
+        seen[key] = node
+        new_nodes.append(node)
+    replace_nodes(graph, new_nodes)
+    rename_inputs(graph, renames)
+    return model_proto
+
+
+def eliminate_identity(model_proto: onnx.ModelProto) -> onnx.ModelProto:
+    """Remove `Identity` nodes, such as those emitted by the `linear` activation."""
+    graph = model_proto.graph
+    outputs = graph_output_names(graph)
+    producers = {name: node for node in graph.node for name in node.output}
+    renames: dict[str, str] = {}
+    new_nodes = []
+    for node in graph.node:
+        if node.op_type != "Identity" or node.domain not in ("", "ai.onnx"):
+            new_nodes.append(node)
+            continue
+        source, target = resolve(renames, node.input[0]), node.output[0]
+        if target not in outputs:
+            renames[target] = source
+            continue
+        # The identity names a graph output: let its producer output it directly
+        producer = producers.get(source)
+        if producer is None or source in outputs:
+            new_nodes.append(node)
+            continue
+        producer.output[list(producer.output).index(source)] = target
+        renames[source] = target
+    replace_nodes(graph, new_nodes)
+    rename_inputs(graph, renames)
+    return model_proto
+
+
+def eliminate_redundant_casts(model_proto: onnx.ModelProto) -> onnx.ModelProto:
+    """Remove `Cast` nodes that don't change the values they are applied to.
+
+    A cast to the type its input already has is dropped, and a cast of a cast
+    skips the first one if it was lossless (e.g. float16 to float32), which
+    removes round trips such as float16 -> float32 -> float16 entirely. Casts
+    that may round or saturate are always kept.
+    """
+    graph = model_proto.graph
+    types = value_elem_types(model_proto)
+    outputs = graph_output_names(graph)
+    cast_sources: dict[str, str] = {}
+    renames: dict[str, str] = {}
+    new_nodes = []
+    for node in graph.node:
+        if node.op_type != "Cast" or node.domain not in ("", "ai.onnx"):
+            new_nodes.append(node)
+            continue
+        source = resolve(renames, node.input[0])
+        inner_source = cast_sources.get(source)
+        if inner_source is not None and types.get(source) in LOSSLESS_CASTS.get(
+            types.get(inner_source), ()
+        ):
+            source = inner_source
+        node.input[0] = source
+        to = next(attr.i for attr in node.attribute if attr.name == "to")
+        if types.get(source) == to and node.output[0] not in outputs:
+            renames[node.output[0]] = source
+            continue
+        cast_sources[node.output[0]] = source
+        new_nodes.append(node)
+    replace_nodes(graph, new_nodes)
+    rename_inputs(graph, renames)
+    return model_proto
+
+
+def fuse_matmul_add(model_proto: onnx.ModelProto) -> onnx.ModelProto:
+    """Fuse 2-D `MatMul` followed by a bias `Add` into a single `Gemm`."""
+    graph = model_proto.graph
+    ranks = value_ranks(model_proto)
+    constants = constant_names(graph)
+    consumers = count_consumers(graph)
+    outputs = graph_output_names(graph)
+    producers = {name: i for i, node in enumerate(graph.node) for name in node.output}
+    nodes = list(graph.node)
+    removed: set[int] = set()
+    for i, node in enumerate(nodes):
+        if node.op_type != "Add" or len(node.input) != 2:
+            continue
+        for matmul_output, bias in (node.input, reversed(node.input)):
+            j = producers.get(matmul_output)
+            if j is None or j in removed or nodes[j].op_type != "MatMul":
+                continue
+            matmul = nodes[j]
+            if (
+                consumers.get(matmul_output) == 1
+                and matmul_output not in outputs
+                and ranks.get(matmul.input[0]) == 2
+                and ranks.get(matmul.input[1]) == 2
+                and bias in constants
+                and ranks.get(bias) == 1
+            ):
+                nodes[i] = onnx.helper.make_node(
+                    "Gemm",
+                    [matmul.input[0], matmul.input[1], bias],
+                    list(node.output),
+                    name=node.name,
+                )
+                removed.add(j)
+                break
+    replace_nodes(graph, [node for i, node in enumerate(nodes) if i not in removed])
+    return model_proto
+
+
+def fold_scale_shift(model_proto: onnx.ModelProto) -> onnx.ModelProto:
+    """Fold a constant `Mul` followed by a constant `Add` into the `Gemm` before.
+
+    This is the affine map of inference mode `BatchNormalization` after a
+    `Dense` layer, so the normalization costs nothing at run time. Unlike other
+    passes, it replaces weights: the kernel and bias become new constants named
+    `{kernel}/folded` and `{kernel}/folded_bias`, which
+    `kerox.export.refresh_weights` can't update. So it isn't one of the
+    `DEFAULT_PASSES`, and is run by passing it explicitly.
+    """
+    graph = model_proto.graph
+    # Read on demand, and weights stored as external data are left as they are
+    tensors = {
+        init.name: init
+        for init in graph.initializer
+        if init.data_location != TensorProto.EXTERNAL
+    }
+    tensors.update(
+        (node.output[0], node.attribute[0].t)
+        for node in graph.node
+        if is_constant_node(node)
+    )
+    consumers = count_consumers(graph)
+    outputs = graph_output_names(graph)
+    producers = {name: i for i, node in enumerate(graph.node) for name in node.output}
+    nodes = list(graph.node)
+    names = {init.name for init in graph.initializer} | set(producers)
+    folded: dict[int, list[onnx.NodeProto]] = {}
+    removed: set[int] = set()
+    for i, add in enumerate(nodes):
+        if add.op_type != "Add" or add.domain not in ("", "ai.onnx"):
+            continue
+        mul_output, shift = affine_operands(add, tensors)
+        j = producers.get(mul_output)
+        if j is None or j in removed or nodes[j].op_type != "Mul":
+            continue
+        gemm_output, scale = affine_operands(nodes[j], tensors)
+        k = producers.get(gemm_output)
+        if k is None or k in removed or nodes[k].op_type != "Gemm":
+            continue
+        gemm = nodes[k]
+        if (
+            gemm.input[1] not in tensors
+            or (len(gemm.input) > 2 and gemm.input[2] and gemm.input[2] not in tensors)
+            or any(consumers.get(name) != 1 for name in (gemm_output, mul_output))
+            or {gemm_output, mul_output} & outputs
+        ):
+            continue
+        attributes = {
+            attr.name: onnx.helper.get_attribute_value(attr) for attr in gemm.attribute
+        }
+        kernel = numpy_helper.to_array(tensors[gemm.input[1]])
+        dtype = kernel.dtype
+        transposed = attributes.get("transB", 0)
+        units = kernel.shape[0] if transposed else kernel.shape[1]
+        scale, shift = (
+            as_channel_vector(numpy_helper.to_array(tensors[name]), units)
+            for name in (scale, shift)
+        )
+        if scale is None or shift is None:
+            continue
+        bias = np.zeros(units)
+        if len(gemm.input) > 2 and gemm.input[2]:
+            bias = numpy_helper.to_array(tensors[gemm.input[2]])
+            bias = as_channel_vector(bias, units)
+            if bias is None:
+                continue
+            bias = bias * attributes.get("beta", 1.0)
+        attributes["beta"] = 1.0
+        kernel_name = unique_name(f"{gemm.input[1]}/folded", names)
+        bias_name = unique_name(f"{gemm.input[1]}/folded_bias", names)
+        kernel = kernel * (scale[:, None] if transposed else scale)
+        folded[i] = [
+            make_constant_node(kernel_name, kernel.astype(dtype)),
+            make_constant_node(bias_name, (bias * scale + shift).astype(dtype)),
+            onnx.helper.make_node(
+                "Gemm",
+                [gemm.input[0], kernel_name, bias_name],
+                list(add.output),
+                name=gemm.name,
+                **attributes,
+            ),
+        ]
+        removed |= {j, k}
+    new_nodes = []
+    for i, node in enumerate(nodes):
+        if i not in removed:
+            new_nodes.extend(folded.get(i, [node]))
+    replace_nodes(graph, new_nodes)
+    return model_proto
+
+
+def as_channel_vector(value: np.ndarray, units: int) -> Optional[np.ndarray]:
+    """`value` as a float64 vector of `units`, if it broadcasts along the last axis."""
+    if value.ndim > 2 or value.size not in (1, units):
+        return None
+    if value.ndim and value.shape[-1] != value.size:
+        return None
+    return np.broadcast_to(value.reshape(-1).astype(np.float64), (units,))
+
+
+def folded_weights(names: Iterable[str], weights: set[str]) -> set[str]:
+    """Constants among `names` that `fold_scale_shift` folded `weights` into."""
+    folded = set()
+    for name in names:
+        weight, _, leaf = name.rpartition("/")
+        if weight in weights and leaf.startswith("folded"):
+            folded.add(name)
+    return folded
+
+
+def unique_name(name: str, names: set[str]) -> str:
+    """`name`, suffixed if needed to differ from `names`, to which it is added."""
+    unique, i = name, 0
+    while unique in names:
+        i += 1
+        unique = f"{name}_{i}"
+    names.add(unique)
+    return unique
+
+
+def affine_operands(
+    node: onnx.NodeProto, constants: dict[str, onnx.TensorProto]
+) -> tuple[Optional[str], Optional[str]]:
+    """Variable and constant inputs of a binary `node`, if it has one of each."""
+    if len(node.input) != 2:
+        return None, None
+    for variable, constant in (node.input, reversed(node.input)):
+        if constant in constants and variable not in constants:
+            return variable, constant
+    return None, None
+
+
+def eliminate_dead_code(model_proto: onnx.ModelProto) -> onnx.ModelProto:
+    """Remove nodes and initializers that don't contribute to any graph output."""
+    graph = model_proto.graph
+    used = graph_output_names(graph)
+    kept = []
+    for node in reversed(graph.node):
+        if set(node.output) & used:
+            kept.append(node)
+            used |= set(node.input) | subgraph_inputs(node)
+    replace_nodes(graph, list(reversed(kept)))
+    initializers = [init for init in graph.initializer if init.name in used]
+    del graph.initializer[:]
+    graph.initializer.extend(initializers)
+    return model_proto
+
+
+DEFAULT_PASSES: tuple[GraphPass, ...] = (
+    fold_constants,
+    deduplicate_constants,
+    eliminate_common_subexpressions,
+    eliminate_identity,
+    eliminate_redundant_casts,
+    fuse_matmul_add,
+)
+
+
+def is_constant_node(node: onnx.NodeProto) -> bool:
+    return (
+        node.op_type == "Constant"
+        and node.domain in ("", "ai.onnx")
+        and len(node.attribute) == 1
+        and node.attribute[0].name == "value"
+    )
+
+
+def constant_value(node: onnx.NodeProto) -> np.ndarray:
+    return numpy_helper.to_array(node.attribute[0].t)
+
+
+def make_constant_node(name: str, value: np.ndarray) -> onnx.NodeProto:
+    return onnx.helper.make_node(
+        "Constant", [], [name], value=numpy_helper.from_array(value, name)
+    )
+
+
+def constant_names(graph: onnx.GraphProto) -> set[str]:
+    names = {init.name for init in graph.initializer}
+    return names | {node.output[0] for node in graph.node if is_constant_node(node)}
+
+
+def graph_output_names(graph: onnx.GraphProto) -> set[str]:
+    return {output.name for output in graph.output}
+
+
+def has_subgraphs(node: onnx.NodeProto) -> bool:
+    return any(attr.type in (attr.GRAPH, attr.GRAPHS) for attr in node.attribute)
+
+
+def iter_subgraphs(node: onnx.NodeProto) -> Iterator[onnx.GraphProto]:
+    for attr in node.attribute:
+        if attr.type == attr.GRAPH:
+            yield attr.g
+        elif attr.type == attr.GRAPHS:
+            yield from attr.graphs
+
+
+def subgraph_inputs(node: onnx.NodeProto) -> set[str]:
+    """Names a node's subgraphs capture from the enclosing scope."""
+    names = set()
+    for subgraph in iter_subgraphs(node):
+        for inner in subgraph.node:
+            names |= set(inner.input) | subgraph_inputs(inner)
+    return names
+
+
+def count_consumers(graph: onnx.GraphProto) -> dict[str, int]:
+    counts: dict[str, int] = {}
+    for node in graph.node:
+        for name in list(node.input) + list(subgraph_inputs(node)):
+            counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def value_ranks(model_proto: onnx.ModelProto) -> dict[str, int]:
+    inferred = onnx.shape_inference.infer_shapes(model_proto).graph
+    ranks = {init.name: len(init.dims) for init in model_proto.graph.initializer}
+    for value_info in (*inferred.input, *inferred.value_info, *inferred.output):
+        tensor_type = value_info.type.tensor_type
+        if tensor_type.HasField("shape"):
+            ranks[value_info.name] = len(tensor_type.shape.dim)
+    return ranks
+
+
+def value_elem_types(model_proto: onnx.ModelProto) -> dict[str, int]:
+    inferred = onnx.shape_inference.infer_shapes(model_proto).graph
+    types = {init.name: init.data_type for init in model_proto.graph.initializer}
+    for node in model_proto.graph.node:
+        if is_constant_node(node):
+            types[node.output[0]] = node.attribute[0].t.data_type
+    for value_info in (*inferred.input, *inferred.value_info, *inferred.output):
+        elem_type = value_info.type.tensor_type.elem_type
+        if elem_type:
+            types[value_info.name] = elem_type
+    return types
+
+
+def replace_nodes(graph: onnx.GraphProto, nodes: Sequence[onnx.NodeProto]):
+    nodes = list(nodes)
+    del graph.node[:]
+    graph.node.extend(nodes)
+
+
+def resolve(renames: dict[str, str], name: str) -> str:
+    while name in renames:
+        name = renames[name]
+    return name
+
+
+def rename_inputs(graph: onnx.GraphProto, renames: dict[str, str]):
+    """Point every use of a value in `renames` (subgraphs included) to its target."""
+    if not renames:
+        return
+    for node in graph.node:
+        for i, name in enumerate(node.input):
+            node.input[i] = resolve(renames, name)
+        for subgraph in iter_subgraphs(node):
+            rename_inputs(subgraph, renames)
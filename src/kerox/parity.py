@@ -0,0 +1,189 @@
+from typing import Optional
+
+import numpy as np
+from keras import tree
+
+from kerox import export, runtime
+from kerox.layers.input_layer import InputLayer, KeroxInput
+from kerox.models import KeroxModel
+
+
+class ParityResult:
+    """Numerical difference between a Keras tensor and its ONNX counterpart.
+
+    Args:
+        name: Output name, or path of the layer for intermediate results.
+        expected: Values computed by Keras.
+        actual: Values computed by ONNX Runtime.
+        atol: Absolute tolerance.
+        rtol: Relative tolerance.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        expected: np.ndarray,
+        actual: np.ndarray,
+        atol: float,
+        rtol: float,
+    ):
+        expected = np.asarray(expected, dtype=np.float64)
+        actual = np.asarray(actual, dtype=np.float64)
+        if expected.shape != actual.shape:
+            raise ValueError(
+                f"Shape mismatch for {name}: Keras {expected.shape}, "
+                f"ONNX {actual.shape}"
+            )
+        abs_error = np.abs(actual - expected)
+        abs_expected = np.abs(expected)
+        self.name = name
+        self.max_abs_error = float(abs_error.max(initial=0.0))
+        self.max_rel_error = float(
+            (abs_error / np.maximum(abs_expected, np.finfo(np.float32).tiny)).max(
+                initial=0.0
+            )
+        )
+        mismatches = ~(abs_error <= atol + rtol * abs_expected)
+        self.mismatch_fraction = float(mismatches.mean()) if mismatches.size else 0.0
+        self.passed = not mismatches.any()
+
+    def __repr__(self):
+        return (
+            f"<ParityResult: name={self.name}, passed={self.passed}, "
+            f"max_abs_error={self.max_abs_error:.3g}, "
+            f"max_rel_error={self.max_rel_error:.3g}, "
+            f"mismatch_fraction={self.mismatch_fraction:.3g}>"
+        )
+
+
+class ParityReport:
+    """Parity results for the outputs and intermediate layers of a model."""
+
+    def __init__(self, outputs: list[ParityResult], layers: list[ParityResult]):
+        self.outputs = outputs
+        self.layers = layers
+
+    @property
+    def passed(self) -> bool:
+        return all(result.passed for result in self.outputs + self.layers)
+
+    def __str__(self):
+        lines = [f"{'name':<40} {'max abs':>10} {'max rel':>10} {'mismatch':>9}"]
+        for result in self.outputs + self.layers:
+            lines.append(
+                f"{result.name:<40} {result.max_abs_error:>10.3g} "
+                f"{result.max_rel_error:>10.3g} {result.mismatch_fraction:>9.2%}"
+                + ("" if result.passed else "  FAILED")
+            )
+        return "\n".join(lines)
+
+
+def random_inputs(model, num_samples: int, seed: Optional[int] = None) -> list:
+    """Draw standard normal inputs matching the signature of `model.inputs`.
+
+    Unknown dimensions besides the batch one are not supported.
+    """
+    rng = np.random.default_rng(seed)
+    xs = []
+    for tensor in export.as_kerox_inputs(model.inputs):
+        batch_dim, *feature_dims = tensor.shape
+        if None in feature_dims:
+            raise ValueError(
+                f"Cannot draw random inputs for {tensor} with unknown dimensions, "
+                "pass recorded inputs instead."
+            )
+        shape = (num_samples, *feature_dims) if batch_dim is None else tensor.shape
+        xs.append(rng.standard_normal(shape).astype(tensor.dtype))
+    return xs
+
+
+def layer_probe(model):
+    """Functional model exposing the output of every layer of `model`, if possible.
+
+    Returns `None` for subclassed models, whose layer outputs aren't symbolic.
+    """
+    if not getattr(model, "inputs", None):
+        return None
+    names, outputs = [], []
+    for layer in model.layers:
+        if isinstance(layer, InputLayer) or len(layer._inbound_nodes) != 1:
+            continue
+        for i, output in enumerate(tree.flatten(layer.output)):
+            names.append(layer.path if i == 0 else f"{layer.path}:{i}")
+            outputs.append(output)
+    if not outputs:
+        return None
+    inputs = model.inputs if len(model.inputs) > 1 else model.inputs[0]
+    return names, KeroxModel(inputs=inputs, outputs=outputs)
+
+
+def check_parity(
+    model,
+    x=None,
+    *,
+    num_samples: int = 1024,
+    seed: Optional[int] = 0,
+    batch_size: int = 1024,
+    per_layer: bool = True,
+    atol: float = 1e-5,
+    rtol: float = 1e-4,
+    **export_kwargs,
+) -> ParityReport:
+    """Compare the Keras forward pass of `model` with its exported ONNX graph.
+
+    Both sides run batched: Keras through `model.predict` and ONNX through an
+    ONNX Runtime session, so thousands of samples can be checked quickly.
+
+    Args:
+        model: A functional or sequential `KeroxModel`. Subclassed models are
+            supported when `x` is given, but only their outputs are compared.
+            They are exported with the `inputs` of `export_kwargs`, or else
+            inputs with the dtypes and per-sample shapes of `x`.
+        x: Recorded inputs, as accepted by `model.predict`. Defaults to
+            `num_samples` standard normal samples drawn with `seed`, for
+            functional and sequential models only.
+        num_samples: Number of random samples if `x` is not given.
+        seed: Seed for the random samples.
+        batch_size: Samples per Keras or ONNX Runtime call.
+        per_layer: Whether to also compare the output of each layer.
+        atol: Absolute tolerance of the comparison.
+        rtol: Relative tolerance of the comparison.
+        **export_kwargs: Forwarded to `kerox.export.build_onnx_model`.
+
+    Returns:
+        A `ParityReport` with one result per model output, and per layer if
+        `per_layer` is set and the model is functional or sequential.
+    """
+    if not getattr(model, "inputs", None) and "inputs" not in export_kwargs:
+        if x is None:
+            raise ValueError(
+                "Subclassed models can't draw random inputs, pass recorded inputs."
+            )
+        export_kwargs["inputs"] = [
+            KeroxInput(shape=np.shape(xi)[1:], dtype=np.asarray(xi).dtype)
+            for xi in tree.flatten(x)
+        ]
+    if x is None:
+        xs = random_inputs(model, num_samples, seed=seed)
+        x = xs[0] if len(xs) == 1 else xs
+
+    def compare(target, names=None):
+        expected = tree.flatten(target.predict(x, batch_size=batch_size, verbose=0))
+        model_proto = export.build_onnx_model(target, **export_kwargs)
+        session = runtime.make_inference_session(model_proto)
+        actual = tree.flatten(runtime.predict(session, x, batch_size=batch_size))
+        names = names or export.io_names("output", len(expected))
+        return [
+            ParityResult(name, e, a, atol=atol, rtol=rtol)
+            for name, e, a in zip(names, expected, actual)
+        ]
+
+    outputs = compare(model)
+    layers = []
+    probe = layer_probe(model) if per_layer else None
+    if probe is not None:
+        layers = compare(probe[1], probe[0])
+    return ParityReport(outputs, layers)
+
+
+__all__ = ["ParityReport", "ParityResult", "check_parity", "random_inputs"]
@@ -0,0 +1,169 @@
+import json
+import os
+import tempfile
+from typing import Optional
+
+import onnx
+
+from kerox import runtime
+
+# Nodes not emitted by a layer, such as casts of the graph outputs
+UNATTRIBUTED = "(graph)"
+
+
+def layer_of(node_name: str) -> str:
+    """Path of the layer that emitted the node `node_name`.
+
+    Nodes emitted by layers are named `{layer.path}/{op_type}_{i}` on export,
+    and ONNX Runtime keeps the name of the first node of its fused nodes.
+    """
+    layer_path, _, _ = node_name.removeprefix("fused ").rpartition("/")
+    return layer_path or UNATTRIBUTED
+
+
+class ProfileReport:
+    """Mean time per run spent in each node of a model, grouped by layer.
+
+    Args:
+        node_times: Mean time per run of each node, in microseconds.
+        node_op_types: Operator type of each node.
+        num_runs: Number of profiled runs the times are averaged over.
+    """
+
+    def __init__(
+        self,
+        node_times: dict[str, float],
+        node_op_types: dict[str, str],
+        num_runs: int,
+    ):
+        self.node_times = node_times
+        self.node_op_types = node_op_types
+        self.num_runs = num_runs
+
+    @property
+    def total_time(self) -> float:
+        """Mean time per run spent in nodes, in microseconds."""
+        return sum(self.node_times.values())
+
+    @property
+    def layer_times(self) -> dict[str, float]:
+        """Mean time per run of each layer in microseconds, slowest first."""
+        times: dict[str, float] = {}
+        for node_name, time in self.node_times.items():
+            layer_path = layer_of(node_name)
+            times[layer_path] = times.get(layer_path, 0.0) + time
+        return dict(sorted(times.items(), key=lambda item: -item[1]))
+
+    def layer_nodes(self, layer_path: str) -> dict[str, float]:
+        """Mean time per run of each node of a layer, slowest first."""
+        return dict(
+            sorted(
+                (
+                    (node_name, time)
+                    for node_name, time in self.node_times.items()
+                    if layer_of(node_name) == layer_path
+                ),
+                key=lambda item: -item[1],
+            )
+        )
+
+    def __str__(self):
+        total = self.total_time or 1.0
+        lines = [f"{'layer':<40} {'us/run':>10} {'share':>7}  ops"]
+        for layer_path, time in self.layer_times.items():
+            op_types = sorted(
+                {self.node_op_types[name] for name in self.layer_nodes(layer_path)}
+            )
+            lines.append(
+                f"{layer_path:<40} {time:>10.1f} {time / total:>7.1%}  "
+                + ", ".join(op_types)
+            )
+        return "\n".join(lines)
+
+
+def read_node_times(
+    profile_path: str | os.PathLike, warmup_runs: int = 0
+) -> tuple[dict[str, float], dict[str, str], int]:
+    """Sum the kernel times of each node in an ONNX Runtime profile.
+
+    Args:
+        profile_path: JSON profile written by `session.end_profiling()`.
+        warmup_runs: Number of leading runs to leave out.
+
+    Returns:
+        The total time of each node in microseconds, the operator type of
+        each node and the number of runs counted.
+    """
+    with open(profile_path) as f:
+        events = json.load(f)
+    runs = sorted(
+        (event for event in events if event.get("name") == "model_run"),
+        key=lambda event: event["ts"],
+    )
+    start = 0
+    if warmup_runs:
+        warmup_end = runs[warmup_runs - 1]
+        start = warmup_end["ts"] + warmup_end["dur"]
+    node_times: dict[str, float] = {}
+    node_op_types: dict[str, str] = {}
+    for event in events:
+        name = event.get("name", "")
+        if event.get("cat") != "Node" or not name.endswith("_kernel_time"):
+            continue
+        if event["ts"] < start:
+            continue
+        node_name = name.removesuffix("_kernel_time")
+        node_times[node_name] = node_times.get(node_name, 0.0) + event["dur"]
+        node_op_types[node_name] = event.get("args", {}).get("op_name", "")
+    return node_times, node_op_types, len(runs) - warmup_runs
+
+
+def profile_layers(
+    model_proto: onnx.ModelProto,
+    x,
+    *,
+    num_runs: int = 10,
+    warmup_runs: int = 1,
+    batch_size: Optional[int] = None,
+    **session_kwargs,
+) -> ProfileReport:
+    """Profile an exported model with ONNX Runtime and attribute times to layers.
+
+    Args:
+        model_proto: Model exported by `kerox.export.build_onnx_model`.
+        x: A NumPy array-like, or a list of them if the model has several inputs.
+        num_runs: Number of profiled runs over `x`.
+        warmup_runs: Number of runs over `x` before the profiled ones.
+        batch_size: Number of samples per session call. If `None`, all samples
+            are run in a single call.
+        **session_kwargs: Forwarded to `kerox.runtime.make_inference_session`.
+
+    Returns:
+        A `ProfileReport` with the mean time per run over `x` of each node and
+        layer.
+    """
+    if num_runs < 1:
+        raise ValueError(f"num_runs must be positive, got {num_runs}")
+    with tempfile.TemporaryDirectory() as directory:
+        session = runtime.make_inference_session(
+            model_proto,
+            profile_file_prefix=os.path.join(directory, "kerox_profile"),
+            **session_kwargs,
+        )
+        for _ in range(warmup_runs + num_runs):
+            runtime.predict(session, x, batch_size=batch_size)
+        profile_path = session.end_profiling()
+        with open(profile_path) as f:
+            num_session_runs = sum(
+                event.get("name") == "model_run" for event in json.load(f)
+            )
+        # A batched run over `x` is made of several session runs
+        session_runs_per_run = num_session_runs // (warmup_runs + num_runs)
+        node_times, node_op_types, _ = read_node_times(
+            profile_path, warmup_runs=warmup_runs * session_runs_per_run
+        )
+    node_times = {name: time / num_runs for name, time in node_times.items()}
+    return ProfileReport(node_times, node_op_types, num_runs)
+
+
+__all__ = ["ProfileReport", "profile_layers", "read_node_times"]
@@ -0,0 +1,186 @@
+from contextvars import ContextVar
+from typing import Iterable, Optional
+
+import numpy as np
+import onnx
+
+from kerox import export
+from kerox.core import KeroxTensor, weight_var
+from kerox.ops.utils import kops, sops, to_spox_var
+
+UINT8_MAX = 255
+INT8_MAX = 127
+
+_calibration_scope: ContextVar[Optional["CalibrationScope"]] = ContextVar(
+    "kerox_calibration_scope", default=None
+)
+
+
+class QuantizationConfig:
+    """Static INT8 quantization parameters for `Dense` layers.
+
+    Args:
+        input_ranges: Calibrated `(min, max)` of the inputs of each `Dense`
+            layer, keyed by layer path. Layers without a range stay in float.
+        per_channel: Whether kernels get one scale per output unit instead of a
+            single scale for the whole kernel.
+    """
+
+    def __init__(
+        self, input_ranges: dict[str, tuple[float, float]], per_channel: bool = True
+    ):
+        self.input_ranges = input_ranges
+        self.per_channel = per_channel
+
+
+class CalibrationScope:
+    """Records the `(min, max)` of the inputs seen by `Dense` layers."""
+
+    def __enter__(self) -> "CalibrationScope":
+        self.input_ranges: dict[str, tuple[float, float]] = {}
+        self._token = _calibration_scope.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _calibration_scope.reset(self._token)
+
+
+def record_input_range(layer, inputs):
+    scope = _calibration_scope.get()
+    if scope is None:
+        return
+    values = kops.convert_to_numpy(inputs)
+    low, high = float(values.min()), float(values.max())
+    if layer.path in scope.input_ranges:
+        prev_low, prev_high = scope.input_ranges[layer.path]
+        low, high = min(low, prev_low), max(high, prev_high)
+    scope.input_ranges[layer.path] = (low, high)
+
+
+def calibrate(
+    model, calibration_data: Iterable, *, max_batches: Optional[int] = None
+) -> dict[str, tuple[float, float]]:
+    """Run `calibration_data` through `model` and collect `Dense` input ranges.
+
+    Args:
+        model: A `KeroxModel`.
+        calibration_data: Iterable of input batches, as accepted by `model(...)`.
+        max_batches: Stop after this many batches. Defaults to all of them.
+
+    Returns:
+        The `(min, max)` of the inputs of each `Dense` layer, keyed by layer path.
+    """
+    with CalibrationScope() as scope:
+        for i, batch in enumerate(calibration_data):
+            if max_batches is not None and i >= max_batches:
+                break
+            model(batch, training=False)
+    return scope.input_ranges
+
+
+def activation_quantization_params(low: float, high: float) -> tuple[float, int]:
+    """Asymmetric `uint8` scale and zero point covering `[low, high]` and zero."""
+    low, high = min(low, 0.0), max(high, 0.0)
+    scale = (high - low) / UINT8_MAX or 1.0
+    zero_point = int(np.clip(round(-low / scale), 0, UINT8_MAX))
+    return scale, zero_point
+
+
+def kernel_quantization_params(
+    kernel: np.ndarray, per_channel: bool
+) -> tuple[np.ndarray, np.ndarray]:
+    """Symmetric `int8` quantized kernel and its scale (one per unit if per channel)."""
+    abs_max = np.abs(kernel).max(axis=0 if per_channel else None)
+    scale = np.where(abs_max > 0, abs_max / INT8_MAX, 1.0).astype(kernel.dtype)
+    quantized = np.clip(np.round(kernel / scale), -INT8_MAX, INT8_MAX)
+    return quantized.astype(np.int8), scale
+
+
+def is_quantized(layer, config: Optional[QuantizationConfig]) -> bool:
+    return config is not None and layer.path in config.input_ranges
+
+
+def quantize_dense_operands(
+    layer, inputs: KeroxTensor, config: QuantizationConfig
+) -> tuple[KeroxTensor, KeroxTensor, Optional[KeroxTensor]]:
+    """Insert QuantizeLinear/DequantizeLinear pairs around a `Dense` operands.
+
+    The input gets a static `uint8` scale from calibration, the kernel is stored
+    as an `int8` initializer and the bias as an `int32` initializer with scale
+    `input_scale * kernel_scale`. ONNX Runtime rewrites the resulting QDQ
+    pattern into integer kernels (`QGemm`, `MatMulIntegerToFloat`).
+
+    Returns:
+        The dequantized input, kernel and bias (`None` if the layer has none).
+    """
+    x = to_spox_var(inputs)
+    x_dtype = x.unwrap_tensor().dtype
+    x_scale_value, x_zero_point_value = activation_quantization_params(
+        *config.input_ranges[layer.path]
+    )
+    x_scale = sops.const(x_scale_value, dtype=x_dtype)
+    x_zero_point = sops.const(x_zero_point_value, dtype=np.uint8)
+    x = sops.dequantize_linear(
+        sops.quantize_linear(x, x_scale, x_zero_point), x_scale, x_zero_point
+    )
+
+    kernel_value = kops.convert_to_numpy(layer._get_kernel_with_merged_lora())
+    q_kernel_value, kernel_scale_value = kernel_quantization_params(
+        kernel_value, config.per_channel
+    )
+    kernel = dequantized_initializer(
+        layer._kernel.path, q_kernel_value, kernel_scale_value, axis=1
+    )
+
+    bias = None
+    if layer.bias is not None:
+        bias_scale_value = (x_scale_value * kernel_scale_value).astype(x_dtype)
+        bias_value = kops.convert_to_numpy(layer.bias)
+        q_bias_value = np.round(bias_value / bias_scale_value).astype(np.int32)
+        bias = dequantized_initializer(
+            layer.bias.path, q_bias_value, bias_scale_value, axis=0
+        )
+    return KeroxTensor(spox_var=x), kernel, bias
+
+
+def dequantized_initializer(
+    name: str, quantized_value: np.ndarray, scale_value: np.ndarray, axis: int
+) -> KeroxTensor:
+    # Explicit zero points are required for ONNX Runtime to fuse the QDQ pattern
+    quantized = weight_var(name, quantized_value)
+    scale = weight_var(f"{name}/scale", scale_value)
+    zero_point = sops.const(np.zeros_like(scale_value, dtype=quantized_value.dtype))
+    dequantized = sops.dequantize_linear(quantized, scale, zero_point, axis=axis)
+    return KeroxTensor(spox_var=dequantized)
+
+
+def quantize(
+    model,
+    calibration_data: Iterable,
+    inputs=None,
+    *,
+    per_channel: bool = True,
+    max_batches: Optional[int] = None,
+    **export_kwargs,
+) -> onnx.ModelProto:
+    """Export `model` to ONNX with statically quantized INT8 `Dense` layers.
+
+    Args:
+        model: A `KeroxModel`.
+        calibration_data: Iterable of input batches used to calibrate the
+            activation scales, as accepted by `model(...)`.
+        inputs: Symbolic inputs to trace the model with, see
+            `kerox.export.build_onnx_model`.
+        per_channel: Whether kernels get one scale per output unit.
+        max_batches: Maximum number of calibration batches to use.
+        **export_kwargs: Forwarded to `kerox.export.build_onnx_model`.
+
+    Returns:
+        The quantized ONNX model, in QDQ format.
+    """
+    input_ranges = calibrate(model, calibration_data, max_batches=max_batches)
+    config = QuantizationConfig(input_ranges, per_channel=per_channel)
+    return export.build_onnx_model(model, inputs, quantization=config, **export_kwargs)
+
+
+__all__ = ["QuantizationConfig", "calibrate", "quantize"]
@@ -0,0 +1,265 @@
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+
+from kerox.external_data import memory_map_initializers
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+EXECUTION_MODES = {
+    "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": ort.ExecutionMode.ORT_PARALLEL,
+}
+ORT_TYPE_TO_NUMPY = {
+    "tensor(float)": np.float32,
+    "tensor(double)": np.float64,
+    "tensor(float16)": np.float16,
+    "tensor(int8)": np.int8,
+    "tensor(int16)": np.int16,
+    "tensor(int32)": np.int32,
+    "tensor(int64)": np.int64,
+    "tensor(uint8)": np.uint8,
+    "tensor(bool)": np.bool_,
+}
+
+
+def make_session_options(
+    *,
+    graph_optimization_level: str = "all",
+    intra_op_num_threads: int = 0,
+    inter_op_num_threads: int = 0,
+    execution_mode: str = "sequential",
+    profile_file_prefix: Optional[str] = None,
+) -> ort.SessionOptions:
+    """Create ONNX Runtime session options from plain Python values.
+
+    Args:
+        graph_optimization_level: One of `"disable"`, `"basic"`, `"extended"`
+            or `"all"`.
+        intra_op_num_threads: Threads used to parallelize a single op.
+            `0` lets ONNX Runtime decide.
+        inter_op_num_threads: Threads used to run independent ops concurrently
+            when `execution_mode="parallel"`. `0` lets ONNX Runtime decide.
+        execution_mode: Either `"sequential"` or `"parallel"`.
+        profile_file_prefix: If set, profile the session runs to a JSON file
+            starting with this prefix, written by `session.end_profiling()`.
+
+    Returns:
+        An `onnxruntime.SessionOptions` instance.
+    """
+    if graph_optimization_level not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(
+            f"Unknown graph_optimization_level: {graph_optimization_level}. "
+            f"Expected one of {list(GRAPH_OPTIMIZATION_LEVELS)}"
+        )
+    if execution_mode not in EXECUTION_MODES:
+        raise ValueError(
+            f"Unknown execution_mode: {execution_mode}. "
+            f"Expected one of {list(EXECUTION_MODES)}"
+        )
+    options = ort.SessionOptions()
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[
+        graph_optimization_level
+    ]
+    options.intra_op_num_threads = intra_op_num_threads
+    options.inter_op_num_threads = inter_op_num_threads
+    options.execution_mode = EXECUTION_MODES[execution_mode]
+    if profile_file_prefix is not None:
+        options.enable_profiling = True
+        options.profile_file_prefix = profile_file_prefix
+    return options
+
+
+def make_inference_session(
+    model_proto: onnx.ModelProto,
+    *,
+    providers: Optional[Sequence[str]] = None,
+    external_data_dir: Optional[str | os.PathLike] = None,
+    **options_kwargs,
+) -> ort.InferenceSession:
+    """Compile an ONNX model into an `onnxruntime.InferenceSession`.
+
+    Args:
+        model_proto: The ONNX model to run.
+        providers: Execution providers, defaults to `["CPUExecutionProvider"]`.
+        external_data_dir: Directory of the external data files referenced by
+            the initializers of `model_proto`, if any. They are memory-mapped
+            and handed to ONNX Runtime without copies, so weights are paged in
+            from disk on demand and shared between sessions of the same files.
+        **options_kwargs: Forwarded to `make_session_options`.
+
+    Returns:
+        A ready to use `onnxruntime.InferenceSession`.
+    """
+    options = make_session_options(**options_kwargs)
+    external_values = []
+    if external_data_dir is not None:
+        arrays = memory_map_initializers(model_proto, external_data_dir)
+        external_values = [ort.OrtValue.ortvalue_from_numpy(a) for a in arrays.values()]
+        if arrays:
+            options.add_external_initializers(list(arrays), external_values)
+    session = ort.InferenceSession(
+        model_proto.SerializeToString(),
+        sess_options=options,
+        providers=list(providers or ["CPUExecutionProvider"]),
+    )
+    # ONNX Runtime uses the mapped buffers in place, they must outlive the session
+    session._kerox_external_values = external_values
+    return session
+
+
+class BoundSession:
+    """Run a session through ONNX Runtime `IOBinding`, reusing output buffers.
+
+    Inputs are bound in place when they already are C-contiguous arrays of the
+    dtype of the session inputs, and only converted otherwise. Outputs with a
+    dynamic batch dimension and static other dimensions are written to buffers
+    allocated once per batch size bucket, the next power of two, so repeated
+    calls don't allocate. Other outputs are allocated by ONNX Runtime.
+
+    Returned arrays are views of the buffers and are overwritten by the next
+    call of the same bucket: copy them to keep them around. A `BoundSession`
+    isn't thread-safe, use one per thread over the same session.
+
+    Args:
+        session: Inference session of an exported model.
+    """
+
+    def __init__(self, session: ort.InferenceSession):
+        self.session = session
+        self._binding = session.io_binding()
+        self._inputs = session.get_inputs()
+        self._outputs = session.get_outputs()
+        self._input_dtypes = [
+            np.dtype(ORT_TYPE_TO_NUMPY[node.type]) for node in self._inputs
+        ]
+        self._output_dtypes = [
+            np.dtype(ORT_TYPE_TO_NUMPY[node.type]) for node in self._outputs
+        ]
+        self._buffers: dict[int, list[Optional[np.ndarray]]] = {}
+        # Binding views of the buffers, keyed by batch size
+        self._bound_outputs: dict[int, list[Optional[tuple]]] = {}
+
+    def output_buffers(self, bucket: int) -> list[Optional[np.ndarray]]:
+        """Output buffers for batches of up to `bucket` samples.
+
+        `None` for outputs whose shape can't be known before running.
+        """
+        if bucket not in self._buffers:
+            buffers = []
+            for node, dtype in zip(self._outputs, self._output_dtypes):
+                batch_dim, *dims = node.shape or [0]
+                if isinstance(batch_dim, int) or not all(
+                    isinstance(dim, int) for dim in dims
+                ):
+                    buffers.append(None)
+                else:
+                    buffers.append(np.empty((bucket, *dims), dtype=dtype))
+            self._buffers[bucket] = buffers
+        return self._buffers[bucket]
+
+    def bound_outputs(self, batch_size: int) -> list[Optional[tuple]]:
+        """`(OrtValue, array)` views of the output buffers for `batch_size`."""
+        if batch_size not in self._bound_outputs:
+            bucket = 1 << max(batch_size - 1, 0).bit_length()
+            self._bound_outputs[batch_size] = [
+                None
+                if buffer is None
+                else (
+                    ort.OrtValue.ortvalue_from_numpy(buffer[:batch_size]),
+                    buffer[:batch_size],
+                )
+                for buffer in self.output_buffers(bucket)
+            ]
+        return self._bound_outputs[batch_size]
+
+    def run(self, x) -> np.ndarray | list[np.ndarray]:
+        """Run a batch through the session.
+
+        Args:
+            x: A NumPy array-like, or a list of them if the model has several
+                inputs.
+
+        Returns:
+            A NumPy array, or a list of them if the model has several outputs.
+        """
+        xs = [x] if len(self._inputs) == 1 else list(x)
+        if len(xs) != len(self._inputs):
+            raise ValueError(
+                f"Expected {len(self._inputs)} inputs, but got {len(xs)} instead."
+            )
+        for node, value, dtype in zip(self._inputs, xs, self._input_dtypes):
+            # No-op for arrays already matching the signature
+            value = np.ascontiguousarray(value, dtype=dtype)
+            if value.ndim != len(node.shape):
+                raise ValueError(
+                    f"Expected input {node.name} of rank {len(node.shape)}, "
+                    f"but got shape {value.shape}."
+                )
+            # Wraps the memory of `value` on CPU, without copying it
+            self._binding.bind_cpu_input(node.name, value)
+        batch_size = np.shape(xs[0])[0] if np.ndim(xs[0]) else 1
+        bound_outputs = self.bound_outputs(batch_size)
+        for node, bound in zip(self._outputs, bound_outputs):
+            if bound is None:
+                self._binding.bind_output(node.name, "cpu")
+            else:
+                self._binding.bind_ortvalue_output(node.name, bound[0])
+        try:
+            self.session.run_with_iobinding(self._binding)
+        finally:
+            # Don't keep the inputs alive past the call
+            self._binding.clear_binding_inputs()
+        outputs = [None if bound is None else bound[1] for bound in bound_outputs]
+        if any(output is None for output in outputs):
+            values = self._binding.get_outputs()
+            outputs = [
+                values[i].numpy() if output is None else output
+                for i, output in enumerate(outputs)
+            ]
+        return outputs[0] if len(outputs) == 1 else outputs
+
+
+def predict(
+    session: ort.InferenceSession, x, batch_size: Optional[int] = None
+) -> np.ndarray | list[np.ndarray]:
+    """Run `x` through `session`, splitting it in batches along the first axis.
+
+    Args:
+        session: Session to run.
+        x: A NumPy array-like, or a list of them if the model has several inputs.
+        batch_size: Number of samples per session call. If `None`, all samples
+            are run in a single call.
+
+    Returns:
+        A NumPy array, or a list of them if the model has several outputs.
+    """
+    session_inputs = session.get_inputs()
+    xs = [x] if len(session_inputs) == 1 else list(x)
+    if len(xs) != len(session_inputs):
+        raise ValueError(
+            f"Expected {len(session_inputs)} inputs, but got {len(xs)} instead."
+        )
+    xs = [
+        np.asarray(value, dtype=ORT_TYPE_TO_NUMPY.get(node.type))
+        for value, node in zip(xs, session_inputs)
+    ]
+    names = [node.name for node in session_inputs]
+    num_samples = xs[0].shape[0]
+    batch_size = batch_size or max(num_samples, 1)
+
+    batches = []
+    for start in range(0, max(num_samples, 1), batch_size):
+        feed = {
+            name: value[start : start + batch_size] for name, value in zip(names, xs)
+        }
+        batches.append(session.run(None, feed))
+    outputs = [np.concatenate(list(output), axis=0) for output in zip(*batches)]
+    return outputs[0] if len(outputs) == 1 else outputs
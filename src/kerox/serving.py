@@ -0,0 +1,333 @@
+import asyncio
+import itertools
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+import onnx
+import onnxruntime as ort
+
+from kerox import runtime
+
+
+class SessionPool:
+    """Sessions of an exported model, run in turn and swapped without downtime.
+
+    The pool quacks like an `onnxruntime.InferenceSession` for `run`,
+    `get_inputs` and `get_outputs`, so it can back a `MicroBatcher` or
+    `kerox.runtime.predict`. `swap` replaces the model, e.g. refreshed with
+    `kerox.export.refresh_weights`, while requests keep being served: the new
+    sessions are created first and then swapped in at once, and runs already
+    started finish on the old ones.
+
+    Args:
+        model_proto: The ONNX model to serve.
+        size: Number of sessions, run in turn by concurrent callers.
+        **session_kwargs: Forwarded to `kerox.runtime.make_inference_session`.
+
+    Example:
+
+    ```python
+    pool = SessionPool(model_proto, size=2, intra_op_num_threads=2)
+    async with MicroBatcher(pool, num_workers=2) as batcher:
+        ...
+        # Off the event loop, since creating sessions takes a while
+        await asyncio.to_thread(pool.swap, onnx.load("refreshed.onnx"))
+    ```
+    """
+
+    def __init__(
+        self, model_proto: onnx.ModelProto, *, size: int = 1, **session_kwargs
+    ):
+        if size < 1:
+            raise ValueError(f"size must be positive, got {size}")
+        self.size = size
+        self.session_kwargs = session_kwargs
+        self._sessions = self._make_sessions(model_proto)
+        self._turns = itertools.count()
+        self.num_swaps = 0
+
+    def _make_sessions(
+        self, model_proto: onnx.ModelProto
+    ) -> list[ort.InferenceSession]:
+        return [
+            runtime.make_inference_session(model_proto, **self.session_kwargs)
+            for _ in range(self.size)
+        ]
+
+    @property
+    def sessions(self) -> list[ort.InferenceSession]:
+        return list(self._sessions)
+
+    def get_inputs(self) -> list:
+        return self._sessions[0].get_inputs()
+
+    def get_outputs(self) -> list:
+        return self._sessions[0].get_outputs()
+
+    def run(self, output_names, input_feed, run_options=None) -> list:
+        """`InferenceSession.run` on the next session of the pool."""
+        sessions = self._sessions
+        session = sessions[next(self._turns) % len(sessions)]
+        return session.run(output_names, input_feed, run_options)
+
+    def swap(self, model_proto: onnx.ModelProto):
+        """Serve `model_proto` instead, which must have the same inputs and outputs.
+
+        Thread-safe with respect to `run`, and blocking while the new sessions
+        are created.
+        """
+        sessions = self._make_sessions(model_proto)
+        old, new = io_signature(self._sessions[0]), io_signature(sessions[0])
+        if old != new:
+            raise ValueError(
+                f"Swapped model has inputs and outputs {new}, but the pool serves "
+                f"{old}."
+            )
+        # Replaced at once, in-flight runs hold a reference to their session
+        self._sessions = sessions
+        self.num_swaps += 1
+
+
+def io_signature(session: ort.InferenceSession) -> tuple[list, list]:
+    return tuple(
+        [(node.name, node.type, node.shape) for node in nodes]
+        for nodes in (session.get_inputs(), session.get_outputs())
+    )
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-sample requests into batched session calls.
+
+    Requests wait in an asyncio queue until `max_batch_size` of them are pending
+    or the oldest one has waited `max_wait_ms`, whichever comes first. The batch
+    then runs on a thread pool, since ONNX Runtime releases the GIL while
+    running, and each request gets back its own row of the outputs. While all
+    workers are busy, requests keep accumulating into the next batch.
+
+    The session must accept any batch size, see `batch_dim` in
+    `kerox.export.build_onnx_model`.
+
+    Args:
+        session: Inference session of an exported model, or a `SessionPool` to
+            swap the served model.
+        max_batch_size: Maximum number of requests per session call.
+        max_wait_ms: Maximum time the first request of a batch waits for more
+            requests to come, in milliseconds.
+        num_workers: Number of batches run concurrently.
+        executor: Executor running the batches. Defaults to a thread pool of
+            `num_workers` threads owned by the batcher.
+
+    Example:
+
+    ```python
+    session = runtime.make_inference_session(model_proto)
+    async with MicroBatcher(session, max_batch_size=64, max_wait_ms=2) as batcher:
+        prediction = await batcher.predict(row)
+    ```
+    """
+
+    def __init__(
+        self,
+        session: ort.InferenceSession | SessionPool,
+        *,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        num_workers: int = 1,
+        executor: Optional[Executor] = None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be positive, got {max_batch_size}")
+        if max_wait_ms < 0:
+            raise ValueError(f"max_wait_ms must be non-negative, got {max_wait_ms}")
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be positive, got {num_workers}")
+        self.session = session
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.num_workers = num_workers
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._inputs = session.get_inputs()
+        self._input_names = [node.name for node in self._inputs]
+        self._input_dtypes = [
+            runtime.ORT_TYPE_TO_NUMPY.get(node.type) for node in self._inputs
+        ]
+        self._queue: Optional[asyncio.Queue] = None
+        self._batch_loop: Optional[asyncio.Task] = None
+        self._running_batches: set[asyncio.Task] = set()
+        self._stopping = False
+        self.num_requests = 0
+        self.num_batches = 0
+
+    @classmethod
+    def from_model_proto(
+        cls,
+        model_proto: onnx.ModelProto,
+        *,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        num_workers: int = 1,
+        **session_kwargs,
+    ) -> "MicroBatcher":
+        """Create a batcher around a new session of `model_proto`.
+
+        `**session_kwargs` are forwarded to `kerox.runtime.make_inference_session`.
+        """
+        session = runtime.make_inference_session(model_proto, **session_kwargs)
+        return cls(
+            session,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            num_workers=num_workers,
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._batch_loop is not None and not self._batch_loop.done()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.num_requests / self.num_batches if self.num_batches else 0.0
+
+    async def start(self):
+        """Start batching requests. Must be called from the serving event loop."""
+        if self.running:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                self.num_workers, thread_name_prefix="kerox-serving"
+            )
+        self._queue = asyncio.Queue()
+        self._stopping = False
+        self._batch_loop = asyncio.create_task(self._run_batch_loop())
+
+    async def stop(self):
+        """Serve the requests made before, then stop batching."""
+        if not self.running:
+            return
+        # Refuses new requests, which would be queued behind the sentinel
+        self._stopping = True
+        await self._queue.put(None)
+        await self._batch_loop
+        while not self._queue.empty():
+            request = self._queue.get_nowait()
+            if request is not None and not request[1].done():
+                request[1].set_exception(
+                    RuntimeError("MicroBatcher stopped before serving the request.")
+                )
+        if self._running_batches:
+            await asyncio.gather(*self._running_batches)
+        self._batch_loop = None
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    async def __aenter__(self) -> "MicroBatcher":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.stop()
+
+    async def predict(self, x) -> np.ndarray | list[np.ndarray]:
+        """Run a single sample through the model, batched with concurrent requests.
+
+        Args:
+            x: A NumPy array-like without batch dimension, or a list of them if
+                the model has several inputs.
+
+        Returns:
+            The outputs for `x`, without batch dimension: a NumPy array, or a
+            list of them if the model has several outputs.
+        """
+        if not self.running:
+            raise RuntimeError("MicroBatcher is not running, call `start` first.")
+        if self._stopping:
+            raise RuntimeError("MicroBatcher is stopping, it takes no new requests.")
+        sample = self._validate_sample(x)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((sample, future))
+        return await future
+
+    def _validate_sample(self, x) -> list[np.ndarray]:
+        xs = [x] if len(self._inputs) == 1 else list(x)
+        if len(xs) != len(self._inputs):
+            raise ValueError(
+                f"Expected {len(self._inputs)} inputs, but got {len(xs)} instead."
+            )
+        sample = []
+        for value, node, dtype in zip(xs, self._inputs, self._input_dtypes):
+            value = np.asarray(value, dtype=dtype)
+            expected_shape = node.shape[1:]
+            if len(value.shape) != len(expected_shape) or any(
+                isinstance(dim, int) and dim != size
+                for dim, size in zip(expected_shape, value.shape)
+            ):
+                raise ValueError(
+                    f"Expected a sample of shape {tuple(expected_shape)} for input "
+                    f"{node.name}, but got shape {value.shape}."
+                )
+            sample.append(value)
+        return sample
+
+    async def _run_batch_loop(self):
+        loop = asyncio.get_running_loop()
+        # Bounds the batches in flight, so requests pile up while workers are busy
+        workers = asyncio.Semaphore(self.num_workers)
+        stopping = False
+        while not stopping:
+            request = await self._queue.get()
+            if request is None:
+                break
+            batch = [request]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                try:
+                    if self._queue.empty():
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        request = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        request = self._queue.get_nowait()
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+            await workers.acquire()
+            task = asyncio.create_task(self._dispatch(batch, workers))
+            self._running_batches.add(task)
+            task.add_done_callback(self._running_batches.discard)
+
+    async def _dispatch(self, batch: list, workers: asyncio.Semaphore):
+        samples, futures = zip(*batch)
+        try:
+            outputs = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._run_batch, samples
+            )
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.num_requests += len(batch)
+            self.num_batches += 1
+            for i, future in enumerate(futures):
+                if not future.done():
+                    rows = [output[i] for output in outputs]
+                    future.set_result(rows[0] if len(rows) == 1 else rows)
+        finally:
+            workers.release()
+
+    def _run_batch(self, samples) -> list[np.ndarray]:
+        feed = {
+            name: np.stack(values)
+            for name, values in zip(self._input_names, zip(*samples))
+        }
+        return self.session.run(None, feed)
+
+
+__all__ = ["MicroBatcher", "SessionPool"]
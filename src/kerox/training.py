@@ -0,0 +1,285 @@
+import os
+import tempfile
+from typing import Optional
+
+import numpy as np
+import onnx
+from keras import callbacks, losses, optimizers, tree, utils
+
+from kerox import export
+from kerox.layers.normalization import BatchNormalization
+
+# Keras losses with an ONNX Runtime training counterpart, all mean reduced
+ORT_LOSSES = {
+    "mean_squared_error": "MSELoss",
+    "mean_absolute_error": "L1Loss",
+    "sparse_categorical_crossentropy": "CrossEntropyLoss",
+    "binary_crossentropy": "BCEWithLogitsLoss",
+}
+LOSS_ALIASES = {"mse": "mean_squared_error", "mae": "mean_absolute_error"}
+# ONNX Runtime computes these losses from logits only
+LOGITS_LOSSES = ("sparse_categorical_crossentropy", "binary_crossentropy")
+
+
+def ort_loss(loss):
+    """Map the loss a model was compiled with to an ONNX Runtime `LossType`."""
+    from onnxruntime.training import artifacts
+
+    if isinstance(loss, str):
+        name, from_logits = LOSS_ALIASES.get(loss, loss), False
+    else:
+        loss = losses.get(loss)
+        name = getattr(loss, "name", None) or getattr(loss, "__name__", None)
+        from_logits = getattr(loss, "from_logits", False)
+    if name not in ORT_LOSSES:
+        raise ValueError(
+            f"Loss {loss} is not supported by ONNX Runtime training. "
+            f"Expected one of {list(ORT_LOSSES)}"
+        )
+    if name in LOGITS_LOSSES and not from_logits:
+        raise ValueError(
+            f"ONNX Runtime training computes {name} from logits, compile the "
+            "model with `from_logits=True` and without a final activation."
+        )
+    return getattr(artifacts.LossType, ORT_LOSSES[name])
+
+
+def ort_optimizer(optimizer: optimizers.Optimizer):
+    """Build the ONNX Runtime optimizer block equivalent to a Keras optimizer."""
+    from onnxruntime.training import onnxblock
+
+    if isinstance(optimizer, optimizers.SGD):
+        if optimizer.momentum or optimizer.nesterov:
+            raise ValueError(
+                "ONNX Runtime training only supports SGD without momentum."
+            )
+        return onnxblock.optim.SGD()
+    if isinstance(optimizer, (optimizers.Adam, optimizers.AdamW)):
+        weight_decay = optimizer.weight_decay or 0.0
+        if isinstance(optimizer, optimizers.Adam) and weight_decay:
+            raise ValueError(
+                "ONNX Runtime training decouples weight decay, use AdamW instead."
+            )
+        return onnxblock.optim.AdamW(
+            betas=(optimizer.beta_1, optimizer.beta_2),
+            eps=optimizer.epsilon,
+            weight_decay=weight_decay,
+        )
+    raise ValueError(
+        f"Optimizer {optimizer.__class__.__name__} is not supported by ONNX "
+        "Runtime training. Expected one of SGD, Adam or AdamW."
+    )
+
+
+def learning_rate(optimizer: optimizers.Optimizer, step: int) -> float:
+    schedule = optimizer._learning_rate
+    if isinstance(schedule, optimizers.schedules.LearningRateSchedule):
+        return float(schedule(step))
+    return float(optimizer.learning_rate)
+
+
+def generate_training_artifacts(
+    model, directory: str | os.PathLike, inputs=None
+) -> list[onnx.ValueInfoProto]:
+    """Export `model` in training mode and generate its ONNX Runtime artifacts.
+
+    Args:
+        model: A compiled `KeroxModel` with a single output.
+        directory: Directory the training, eval and optimizer models and the
+            checkpoint are written to.
+        inputs: Symbolic inputs to trace the model with. Defaults to
+            `model.inputs`.
+
+    Returns:
+        The inputs of the training model: those of `model` followed by labels.
+    """
+    from onnxruntime.training import artifacts
+
+    # The training graph normalizes by batch statistics without updating the
+    # moving ones, which inference would then keep using at their initial value
+    batch_normalizations = [
+        layer.path or layer.name
+        for layer in model._flatten_layers(include_self=False)
+        if isinstance(layer, BatchNormalization) and layer.trainable
+    ]
+    if batch_normalizations:
+        raise ValueError(
+            "ONNX Runtime training doesn't update the moving statistics of "
+            f"BatchNormalization layers {batch_normalizations}. Train the model "
+            "with Keras, or freeze them with `layer.trainable = False`."
+        )
+    loss = ort_loss(model.loss)
+    optimizer = ort_optimizer(model.optimizer)
+    # LoRA adapters stay separate weights, so only they are trained
+    model_proto = export.build_onnx_model(
+        model, inputs, training=True, merge_lora=False, optimize=False
+    )
+    if len(model_proto.graph.output) != 1:
+        raise ValueError(
+            "ONNX Runtime training supports models with a single output, but got "
+            f"{len(model_proto.graph.output)} outputs."
+        )
+    initializers = {tensor.name for tensor in model_proto.graph.initializer}
+    artifacts.generate_artifacts(
+        model_proto,
+        requires_grad=[
+            variable.path
+            for variable in model.trainable_variables
+            if variable.path in initializers
+        ],
+        loss=loss,
+        optimizer=optimizer,
+        artifact_directory=directory,
+    )
+    training_model = onnx.load(
+        os.path.join(directory, "training_model.onnx"), load_external_data=False
+    )
+    return list(training_model.graph.input)
+
+
+def fit_onnxruntime(
+    model,
+    x,
+    y,
+    *,
+    batch_size: Optional[int] = None,
+    epochs: int = 1,
+    verbose: int | str = "auto",
+    shuffle: bool = True,
+    validation_data: Optional[tuple] = None,
+    inputs=None,
+) -> callbacks.History:
+    """Train `model` with ONNX Runtime training instead of the Keras loop.
+
+    The model is exported in training mode and ONNX Runtime generates its
+    gradient graph, the graph of its optimizer and a checkpoint of its weights.
+    Epochs then run entirely in ONNX Runtime, and the trained weights are
+    assigned back to the Keras variables of the same path at the end.
+
+    The loss and optimizer are those the model was compiled with. Supported
+    losses are mean squared and absolute errors, and sparse categorical and
+    binary crossentropies from logits. Supported optimizers are SGD without
+    momentum, Adam and AdamW. Metrics and callbacks are not supported, nor are
+    trainable `BatchNormalization` layers, whose moving statistics wouldn't be
+    updated.
+
+    Args:
+        model: A compiled `KeroxModel` with a single output.
+        x: A NumPy array-like, or a list of them if the model has several inputs.
+        y: Targets, a NumPy array-like.
+        batch_size: Number of samples per gradient update. Defaults to 32.
+        epochs: Number of passes over the data.
+        verbose: `0` for silent, `1` for a progress bar and `2` for one line
+            per epoch. `"auto"` is `1`.
+        shuffle: Whether to shuffle the samples before each epoch.
+        validation_data: Optional `(x_val, y_val)` tuple whose loss is computed
+            with the eval model at the end of each epoch.
+        inputs: Symbolic inputs to trace the model with. Defaults to
+            `model.inputs`.
+
+    Returns:
+        A `keras.callbacks.History` with the `loss`, and `val_loss` if
+        `validation_data` is given, of each epoch.
+    """
+    # onnxruntime-training is only imported when training with it
+    from onnxruntime.training import api
+
+    if not model.compiled:
+        raise ValueError("You must call `compile()` before using the model.")
+    batch_size = batch_size or 32
+    verbose = 1 if verbose == "auto" else verbose
+    with tempfile.TemporaryDirectory() as directory:
+        training_inputs = generate_training_artifacts(model, directory, inputs)
+        state = api.CheckpointState.load_checkpoint(
+            os.path.join(directory, "checkpoint")
+        )
+        module = api.Module(
+            os.path.join(directory, "training_model.onnx"),
+            state,
+            os.path.join(directory, "eval_model.onnx"),
+        )
+        optimizer = api.Optimizer(
+            os.path.join(directory, "optimizer_model.onnx"), module
+        )
+        # Parameters are graph inputs of the training model too
+        user_inputs = set(module.input_names())
+        training_inputs = [
+            value_info
+            for value_info in training_inputs
+            if value_info.name in user_inputs
+        ]
+    *xs, y = as_training_feed([*tree.flatten(x), y], training_inputs)
+
+    history = callbacks.History()
+    history.set_model(model)
+    history.on_train_begin()
+    num_samples = len(y)
+    num_steps = -(-num_samples // batch_size)
+    step = 0
+    for epoch in range(epochs):
+        if verbose:
+            print(f"Epoch {epoch + 1}/{epochs}")
+        progbar = utils.Progbar(num_steps, verbose=verbose)
+        order = np.random.permutation(num_samples) if shuffle else None
+        module.train()
+        epoch_losses = []
+        for i, start in enumerate(range(0, num_samples, batch_size)):
+            batch = slice(start, start + batch_size)
+            indices = batch if order is None else order[batch]
+            optimizer.set_learning_rate(learning_rate(model.optimizer, step))
+            loss = float(module(*(value[indices] for value in xs), y[indices]))
+            optimizer.step()
+            module.lazy_reset_grad()
+            step += 1
+            epoch_losses.append(loss)
+            progbar.update(i + 1, [("loss", loss)])
+        logs = {"loss": float(np.mean(epoch_losses))}
+        if validation_data is not None:
+            x_val, y_val = validation_data
+            feed = as_training_feed([*tree.flatten(x_val), y_val], training_inputs)
+            logs["val_loss"] = evaluate(module, feed)
+        history.on_epoch_end(epoch, logs)
+
+    parameters = state.parameters
+    for variable in model.trainable_variables:
+        if variable.path in parameters:
+            variable.assign(parameters[variable.path].data)
+    return history
+
+
+def as_training_feed(
+    values: list, value_infos: list[onnx.ValueInfoProto]
+) -> list[np.ndarray]:
+    """Convert inputs and labels to the dtypes and ranks of the training model.
+
+    Sparse labels given as a column of class indices become a vector.
+    """
+    if len(values) != len(value_infos):
+        raise ValueError(
+            f"Expected {len(value_infos) - 1} inputs, "
+            f"but got {len(values) - 1} instead."
+        )
+    feed = []
+    for value, value_info in zip(values, value_infos):
+        tensor_type = value_info.type.tensor_type
+        value = np.asarray(
+            value, dtype=onnx.helper.tensor_dtype_to_np_dtype(tensor_type.elem_type)
+        )
+        if value.ndim == len(tensor_type.shape.dim) + 1 and value.shape[-1] == 1:
+            value = value[..., 0]
+        feed.append(value)
+    return feed
+
+
+def evaluate(module, feed: list[np.ndarray], batch_size: int = 1024) -> float:
+    """Mean loss of the eval model of `module` over inputs and labels `feed`."""
+    module.eval()
+    num_samples = len(feed[0])
+    total = 0.0
+    for start in range(0, num_samples, batch_size):
+        batch = [value[start : start + batch_size] for value in feed]
+        total += float(module(*batch)) * len(batch[0])
+    return total / max(num_samples, 1)
+
+
+__all__ = ["fit_onnxruntime", "generate_training_artifacts"]